@@ -8,13 +8,31 @@ __license__ = "Apache License 2.0"
 
 
 __all__ = [
-    "WsgiApp", "Dispatcher", "Request", "Response", "Router"
+    "WsgiApp", "Dispatcher", "Request", "Response", "Router", "Route", "Converter",
+    "RequestLimits", "StreamContent", "FileContent", "StaticFiles",
+    "ResponseCache", "CacheBackend", "MemoryCacheBackend", "Headers",
+    "EnvironHeaders", "AsgiAdapter", "Timing", "Metrics",
+    "Profiler", "AdmissionControl", "PreforkServer", "LogQueue",
+    "DuplicateFilter", "AccessLog"
 ]
 
 
 from .app import WsgiApp
-from .exchange import Request, Response, Exchange
-from .router import Router
+from .exchange import Request, Response, Exchange, RequestLimits
+from .router import Router, Route
+from .converters import Converter
+from .content import StreamContent, FileContent
+from .static import StaticFiles
+from .cache import ResponseCache, CacheBackend, MemoryCacheBackend
+from .headers import Headers, EnvironHeaders
+from .asgi import AsgiAdapter
+from .timing import Timing
+from .metrics import Metrics
+from .profiling import Profiler
+from .admission import AdmissionControl
+from .server import PreforkServer
+from .logqueue import LogQueue, DuplicateFilter
+from .access import AccessLog
 
 from .error import *
 from .error import __all__ as _error__all
@@ -0,0 +1,36 @@
+""" Restart background threads in forked children. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["started", "stopped"]
+
+
+import os
+import weakref
+
+
+_started = weakref.WeakSet()
+
+
+def started(obj):
+    """ Call obj._after_fork in each forked child until stopped. """
+    _started.add(obj)
+
+
+def stopped(obj):
+    """ No longer call obj._after_fork in forked children. """
+    _started.discard(obj)
+
+
+def _after_fork():
+    for obj in list(_started):
+        obj._after_fork() # pylint: disable=protected-access
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,141 @@
+""" Structured access log. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["AccessLog"]
+
+
+from collections import deque
+import json
+import threading
+import time
+
+from . import _fork
+
+
+class AccessLog:
+    """ Write an entry for each request as a line of JSON.
+        Logging an exchange only appends a tuple to a buffer of at most
+        size entries, and entries are dropped and counted when it is full
+        so requests never wait on the log.  A thread writes the buffer in
+        batches every interval seconds, or sooner once batch entries are
+        waiting.  Each entry has the time, method, path, route name and
+        pattern, status, bytes (null for streams of unknown length),
+        duration in seconds since the exchange started, and remote address.
+        A started log restarts its thread in a forked child and drops the
+        entries the parent had buffered.
+    """
+
+    def __init__(self, stream=None, filename=None, size=8192, batch=512, interval=1.0):
+        """ Initialize the access log with a text stream or a filename. """
+        if (stream is None) == (filename is None):
+            raise ValueError("Either stream or filename must be given")
+
+        self.stream = stream
+        self.filename = filename
+        self.size = size
+        self.batch = batch
+        self.interval = interval
+        self.dropped = 0
+
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def log(self, exchange):
+        """ Add an entry for an exchange. """
+        buffer = self._buffer
+        if len(buffer) >= self.size:
+            self.dropped += 1
+            return
+
+        now = time.monotonic()
+        route = exchange.route
+        response = exchange.response
+        environ = exchange.environ
+        buffer.append((
+            time.time(),
+            environ.get("REQUEST_METHOD"),
+            environ.get("PATH_INFO"),
+            route.name if route is not None else None,
+            route.path if route is not None else None,
+            response.status,
+            response.content_length,
+            now - exchange.timer if exchange.timer is not None else None,
+            environ.get("REMOTE_ADDR")
+        ))
+
+        if len(buffer) == self.batch:
+            self._wakeup.set()
+
+    def start(self):
+        """ Start the writer thread. """
+        if self._thread is not None:
+            return
+
+        if self.filename is not None and self.stream is None:
+            self.stream = open(self.filename, "a", encoding="utf-8")
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._thread.start()
+        _fork.started(self)
+
+    def stop(self):
+        """ Write the remaining entries and stop the writer thread. """
+        if self._thread is None:
+            return
+
+        _fork.stopped(self)
+        self._running = False
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+        if self.filename is not None:
+            self.stream.close()
+            self.stream = None
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """ Write the buffered entries. """
+        buffer = self._buffer
+        lines = []
+        for _ in range(len(buffer)):
+            (when, method, path, name, pattern, status, size, duration, remote) = buffer.popleft()
+            lines.append(json.dumps({
+                "time": round(when, 3),
+                "method": method,
+                "path": path,
+                "route": name,
+                "pattern": pattern,
+                "status": status,
+                "bytes": size,
+                "duration": round(duration, 6) if duration is not None else None,
+                "remote": remote
+            }))
+
+        if lines:
+            lines.append("")
+            self.stream.write("\n".join(lines))
+            self.stream.flush()
+
+    def _after_fork(self):
+        self._buffer.clear()
+        self._wakeup = threading.Event()
+        self._thread = None
+        if self.filename is not None:
+            self.stream = None # Shared with the parent, reopened by start
+        self.start()
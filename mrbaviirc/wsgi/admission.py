@@ -0,0 +1,256 @@
+""" Admission control for concurrent requests. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["AdmissionControl"]
+
+
+import asyncio
+from collections import deque
+import threading
+import time
+
+
+class _Limiter:
+    """ A limit on in flight requests with a bounded wait queue.
+        Threads wait on a condition and coroutines on a future, which
+        release hands its slot to directly.
+    """
+
+    __slots__ = (
+        "name", "limit", "queue", "in_flight", "waiting", "admitted",
+        "rejected", "queued", "queue_time", "_cond", "_waiters"
+    )
+
+    def __init__(self, name, limit, queue):
+        self.name = name
+        self.limit = limit
+        self.queue = queue # Maximum number of waiting requests
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0 # Admitted after waiting
+        self.queue_time = 0.0 # Total seconds waited by admitted requests
+
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = deque() # (loop, future) of waiting coroutines
+
+    def try_acquire(self):
+        """ Take a slot if one is free without waiting. """
+        with self._cond:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            return False
+
+    def acquire(self, timeout):
+        """ Take a slot, waiting in the queue if there is room in it. """
+        with self._cond:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            start = time.monotonic()
+            try:
+                ready = self._cond.wait_for(lambda: self.in_flight < self.limit, timeout)
+            finally:
+                self.waiting -= 1
+
+            if not ready:
+                self.rejected += 1
+                return False
+
+            self.in_flight += 1
+            self.admitted += 1
+            self.queued += 1
+            self.queue_time += time.monotonic() - start
+            return True
+
+    async def aacquire(self, timeout):
+        """ Take a slot, waiting on the event loop instead of a thread. """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        future = waiter[1]
+        start = time.monotonic()
+        ready = False
+        try:
+            ready = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if not ready:
+                future.cancel()
+
+            with self._cond:
+                self.waiting -= 1
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass # Handed a slot, which _wake gives back if cancelled
+
+                if ready:
+                    self.admitted += 1
+                    self.queued += 1
+                    self.queue_time += time.monotonic() - start
+                else:
+                    self.rejected += 1
+
+            if not ready and future.done() and not future.cancelled():
+                self.release() # The slot came just as the wait ended
+
+        return ready
+
+    def _wake(self, future):
+        """ Pass a handed over slot to a waiting coroutine on its loop. """
+        if future.done():
+            self.release() # It stopped waiting, so pass the slot on
+        else:
+            future.set_result(True)
+
+    def release(self):
+        """ Give back a slot, or hand it to the first waiting coroutine. """
+        with self._cond:
+            if self._waiters:
+                (loop, future) = self._waiters.popleft()
+                loop.call_soon_threadsafe(self._wake, future)
+                return
+
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        """ Return the counters. """
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "queued": self.queued,
+                "queue_time": self.queue_time
+            }
+
+
+class AdmissionControl:
+    """ Limit the requests handled at once.
+        There is a global limit, and routes registered with a concurrency
+        option have their own limit.  Once a limit is reached, up to queue
+        requests wait for at most timeout seconds and any others are turned
+        away so the app can answer 503 with a Retry-After header.  A limit
+        of 0 means no limit.  The state is per process, so under a multi
+        process server each process applies the limits on its own.
+    """
+
+    def __init__(self, limit=0, queue=0, timeout=1.0, retry_after=1):
+        """ Initialize admission control. """
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._global = _Limiter("global", limit, queue) if limit > 0 else None
+        self._routes = {} # Route: _Limiter
+        self._lock = threading.Lock() # Only for creating route limiters
+
+    def _limiter(self, route):
+        """ Return the limiter of a route, or the global one for None. """
+        if route is None:
+            return self._global
+
+        limiter = self._routes.get(route)
+        if limiter is None:
+            limit = route.options.get("concurrency")
+            if not limit:
+                return None
+
+            with self._lock:
+                limiter = self._routes.get(route)
+                if limiter is None:
+                    name = "{0} {1}".format(route.method, route.path)
+                    limiter = self._routes[route] = _Limiter(name, int(limit), self.queue)
+
+        return limiter
+
+    def try_acquire(self, route=None):
+        """ Admit a request without waiting.  Return False if full. """
+        limiter = self._limiter(route)
+        return limiter is None or limiter.try_acquire()
+
+    def acquire(self, route=None):
+        """ Admit a request, waiting if needed.  Return False if rejected. """
+        limiter = self._limiter(route)
+        return limiter is None or limiter.acquire(self.timeout)
+
+    async def aacquire(self, route=None):
+        """ Admit a request from a coroutine, waiting on the event loop
+            instead of blocking a thread.  Return False if rejected.
+        """
+        limiter = self._limiter(route)
+        return limiter is None or await limiter.aacquire(self.timeout)
+
+    def release(self, route=None):
+        """ End an admitted request. """
+        limiter = self._limiter(route)
+        if limiter is not None:
+            limiter.release()
+
+    def stats(self):
+        """ Return a dict of limit name to its counters. """
+        limiters = list(self._routes.values())
+        if self._global is not None:
+            limiters.insert(0, self._global)
+
+        return {limiter.name: limiter.stats() for limiter in limiters}
+
+    def prometheus(self):
+        """ Return the counters in the Prometheus text format. """
+        metrics = (
+            ("in_flight", "gauge", "Admitted requests being handled."),
+            ("waiting", "gauge", "Requests waiting in the queue."),
+            ("admitted", "counter", "Admitted requests."),
+            ("rejected", "counter", "Requests turned away with 503."),
+            ("queued", "counter", "Requests admitted after waiting."),
+            ("queue_time", "counter", "Seconds admitted requests waited.")
+        )
+
+        stats = self.stats()
+        lines = []
+        for (key, kind, description) in metrics:
+            name = "http_admission_" + key
+            if kind == "counter":
+                name += "_seconds_total" if key == "queue_time" else "_total"
+
+            lines.append("# HELP {0} {1}".format(name, description))
+            lines.append("# TYPE {0} {1}".format(name, kind))
+            for (limit, values) in stats.items():
+                limit = limit.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append('{0}{{limit="{1}"}} {2!r}'.format(name, limit, values[key]))
+
+        return "\n".join(lines) + "\n"
@@ -10,8 +10,9 @@ __license__ = "Apache License 2.0"
 __all__ = ["WsgiApp"]
 
 
+import asyncio
 import html
-import io
+import sys
 import traceback
 
 import logging
@@ -20,9 +21,18 @@ from mrbaviirc.common.app import BaseApp
 from mrbaviirc.common.functools import lazy_property
 from mrbaviirc.common.logging import SharedLogFile
 
+from .access import AccessLog
+from .admission import AdmissionControl
+from .cache import MemoryCacheBackend, ResponseCache
+from .compress import Compressor
 from .router import Router
 from .error import * # pylint: disable=wildcard-import,unused-wildcard-import
-from .exchange import Exchange
+from .exchange import Exchange, RequestLimits
+from .logqueue import LogQueue
+from .metrics import Metrics
+from .profiling import Profiler
+from .server import PreforkServer
+from .static import StaticFiles
 
 class WsgiApp(BaseApp):
     """ A helper class for web applications. """
@@ -33,18 +43,76 @@ class WsgiApp(BaseApp):
 
         # Configs
         self.config.set("webapp.debug", False)
+        self.config.set("webapp.router.cache_size", 0)
+        self.config.set("webapp.router.negative_cache_size", 0)
+        self.config.set("webapp.upload.memory_limit", 1048576)
+        self.config.set("webapp.upload.chunk_size", 65536)
+        self.config.set("webapp.request.max_body", 0)
+        self.config.set("webapp.request.max_field_size", 0)
+        self.config.set("webapp.request.max_file_size", 0)
+        self.config.set("webapp.request.max_fields", 0)
+        self.config.set("webapp.etag", False)
+        self.config.set("webapp.cache.enabled", False)
+        self.config.set("webapp.cache.size", 1024)
+        self.config.set("webapp.cache.stale_ttl", 30)
+        self.config.set("webapp.cache.vary", ())
+        self.config.set("webapp.cache.wait_timeout", 10.0)
+        self.config.set("webapp.compress.enabled", False)
+        self.config.set("webapp.compress.min_size", 1024)
+        self.config.set("webapp.compress.level", 6)
+        self.config.set("webapp.compress.cache_size", 0)
+        self.config.set("webapp.asgi.threads", 32)
+        self.config.set("webapp.timing.enabled", False)
+        self.config.set("webapp.timing.header", False)
+        self.config.set("webapp.metrics.enabled", False)
+        self.config.set("webapp.metrics.path", None)
+        self.config.set("webapp.profile.enabled", False)
+        self.config.set("webapp.profile.directory", None)
+        self.config.set("webapp.profile.sample_rate", 0.0)
+        self.config.set("webapp.profile.routes", ())
+        self.config.set("webapp.profile.header", "X-Profile")
+        self.config.set("webapp.profile.secret", None)
+        self.config.set("webapp.profile.tracemalloc", False)
+        self.config.set("webapp.profile.keep", 20)
+        self.config.set("webapp.admission.enabled", False)
+        self.config.set("webapp.admission.limit", 0)
+        self.config.set("webapp.admission.queue", 0)
+        self.config.set("webapp.admission.timeout", 1.0)
+        self.config.set("webapp.admission.retry_after", 1)
+        self.config.set("webapp.server.workers", 0)
+        self.config.set("webapp.server.keepalive", 5.0)
+        self.config.set("webapp.server.graceful_timeout", 30.0)
+        self.config.set("webapp.log.queue_size", 10000)
+        self.config.set("webapp.log.dedup_interval", 60.0)
+        self.config.set("webapp.access_log.enabled", False)
+        self.config.set("webapp.access_log.filename", None)
+        self.config.set("webapp.access_log.size", 8192)
+        self.config.set("webapp.access_log.batch", 512)
+        self.config.set("webapp.access_log.interval", 1.0)
 
         # Properties
         self.__startup_called = False
+        self.__route_snapshot = None
 
         self.router = Router()
-
-        # TODO: better logging
-        # leave request logging to the application server (apache/etc)
-        # leave error logging as well, just write errors to stderr)
+        self.request_limits = RequestLimits()
+        self.compressor = None
+        self.etag = False
+        self.response_cache = None # Set before startup to use another backend
+        self.timing = False
+        self.timing_header = False
+        self.timing_sink = None # Called with (exchange, timing) if timing
+        self.metrics = None
+        self.profiler = None
+        self.admission = None
+
+        # errors are written to log_handlers by a background thread, and
+        # requests to the access log if enabled
+        self.log_handlers = [logging.StreamHandler()]
+        self.access_log = None # Set before startup to use another stream
+        self.log_queue = None
         self._logger = logging.getLogger(self.appname)
         self._logger.propagate = False
-        self._logger.addHandler(logging.StreamHandler())
 
     def startup(self):
         """ Startup the application.
@@ -53,8 +121,108 @@ class WsgiApp(BaseApp):
             it automatically calls startup.
         """
         BaseApp.startup(self)
+        if self.log_queue is None:
+            self.log_queue = LogQueue(
+                self.log_handlers,
+                size=int(self.config.get("webapp.log.queue_size", 10000)),
+                interval=float(self.config.get("webapp.log.dedup_interval", 60.0))
+            )
+            self._logger.addHandler(self.log_queue.handler)
+        self.log_queue.start()
+        if self.access_log is None and self.config.get("webapp.access_log.enabled", False):
+            filename = self.config.get("webapp.access_log.filename", None)
+            self.access_log = AccessLog(
+                stream=None if filename else sys.stderr,
+                filename=filename or None,
+                size=int(self.config.get("webapp.access_log.size", 8192)),
+                batch=int(self.config.get("webapp.access_log.batch", 512)),
+                interval=float(self.config.get("webapp.access_log.interval", 1.0))
+            )
+        if self.access_log is not None:
+            self.access_log.start()
+        self.request_limits = RequestLimits.from_config(self.config)
+        self.etag = self.config.get("webapp.etag", False)
+        self.timing = bool(self.config.get("webapp.timing.enabled", False))
+        self.timing_header = bool(self.config.get("webapp.timing.header", False))
+        if self.response_cache is None and self.config.get("webapp.cache.enabled", False):
+            self.response_cache = ResponseCache(
+                MemoryCacheBackend(int(self.config.get("webapp.cache.size", 1024))),
+                vary=self.config.get("webapp.cache.vary", ()),
+                stale_ttl=float(self.config.get("webapp.cache.stale_ttl", 30)),
+                wait_timeout=float(self.config.get("webapp.cache.wait_timeout", 10.0))
+            )
+        if self.config.get("webapp.admission.enabled", False):
+            self.admission = AdmissionControl(
+                limit=int(self.config.get("webapp.admission.limit", 0)),
+                queue=int(self.config.get("webapp.admission.queue", 0)),
+                timeout=float(self.config.get("webapp.admission.timeout", 1.0)),
+                retry_after=int(self.config.get("webapp.admission.retry_after", 1))
+            )
+        if self.config.get("webapp.profile.enabled", False):
+            directory = self.config.get("webapp.profile.directory", None)
+            if not directory:
+                raise ConfigError("webapp.profile.directory must be set to profile")
+
+            self.profiler = Profiler(
+                directory,
+                sample_rate=float(self.config.get("webapp.profile.sample_rate", 0.0)),
+                routes=self.config.get("webapp.profile.routes", ()),
+                header=self.config.get("webapp.profile.header", "X-Profile"),
+                secret=self.config.get("webapp.profile.secret", None),
+                tracemalloc=bool(self.config.get("webapp.profile.tracemalloc", False)),
+                keep=int(self.config.get("webapp.profile.keep", 20))
+            )
+        if self.config.get("webapp.compress.enabled", False):
+            self.compressor = Compressor(
+                min_size=int(self.config.get("webapp.compress.min_size", 1024)),
+                level=int(self.config.get("webapp.compress.level", 6)),
+                cache_size=int(self.config.get("webapp.compress.cache_size", 0))
+            )
+        self.router.set_cache(
+            int(self.config.get("webapp.router.cache_size", 0)),
+            int(self.config.get("webapp.router.negative_cache_size", 0))
+        )
+
+        if self.__route_snapshot is not None:
+            self.router.prune()
+            if self.router.changed:
+                self.router.save(*self.__route_snapshot)
+
+        if self.config.get("webapp.metrics.enabled", False):
+            self.metrics = Metrics()
+            if self.admission is not None:
+                self.metrics.collectors.append(self.admission.prometheus)
+
+            # Registered after saving the snapshot since it is a bound method
+            path = self.config.get("webapp.metrics.path", None)
+            if path:
+                self.router.register(path, self.metrics.handle, name="metrics")
+
+        self.router.freeze()
         self.__startup_called = True
 
+    def shutdown(self):
+        """ Shutdown the application. """
+        if self.access_log is not None:
+            self.access_log.stop()
+        if self.log_queue is not None:
+            self.log_queue.stop()
+        BaseApp.shutdown(self)
+
+    @property
+    def started(self):
+        """ Whether startup has been called. """
+        return self.__startup_called
+
+    @lazy_property
+    def asgi(self):
+        """ The ASGI application, for example "myapp:app.asgi" for uvicorn.
+            The routes, error handling, and settings are shared with the
+            WSGI application.
+        """
+        from .asgi import AsgiAdapter
+        return AsgiAdapter(self, int(self.config.get("webapp.asgi.threads", 32)))
+
     @property
     def appname(self):
         # pylint: disable=no-self-use
@@ -65,14 +233,66 @@ class WsgiApp(BaseApp):
         """
         return Exchange(self, environ)
 
-    def route(self, path, method="GET", name=None):
+    def load_routes(self, filename, fingerprint=""):
+        """ Load the routes from a snapshot file.
+            This should be called before any routes are registered.  Routes
+            in the snapshot are then not parsed again when registered.  If
+            the snapshot is missing or stale, the routes are registered as
+            normal and startup saves a new snapshot.
+        """
+        self.__route_snapshot = (filename, fingerprint)
+        return self.router.load(filename, fingerprint)
+
+    def route(self, path, method="GET", name=None, **options):
+        """ Decorator to register a route.
+            The handler may be an async def function.  Under ASGI it runs on
+            the event loop while other handlers run in a thread pool.  Under
+            WSGI it is run to completion in the request thread.
+            Supported options:
+                etag: True or "strong" for a strong ETag generated from the
+                    content, "weak" for a weak one, or False for none.  The
+                    default comes from the "webapp.etag" config.
+                cache: Number of seconds to cache the full response for if
+                    the response cache is enabled.
+                cache_vary: Extra request headers the cached response
+                    depends on.
+                concurrency: The most requests to the route handled at
+                    once if admission control is enabled.
+        """
         def wrapper(fn):
-            self.router.register(path, fn, method=method, name=name)
+            self.router.register(path, fn, method=method, name=name, **options)
             return fn
         return wrapper
 
-    def run(self, host, port, threaded=False, processes=1):
-        """ Run the app. """
+    def static(self, path, directory, name=None, **kwargs):
+        """ Serve the files under a directory at path/<path:path>.
+            Any extra arguments are passed to StaticFiles.
+        """
+        handler = StaticFiles(directory, **kwargs)
+        pattern = path.rstrip("/") + "/<path:path>"
+
+        self.router.register(pattern, handler, method="GET", name=name)
+        self.router.register(pattern, handler, method="HEAD")
+        return handler
+
+    def run(self, host, port, threaded=False, processes=1, workers=None):
+        """ Run the app.
+            With workers, or webapp.server.workers set, the app is served by
+            a PreforkServer with that many worker processes.  Otherwise the
+            werkzeug development server is used.
+        """
+        if workers is None:
+            workers = int(self.config.get("webapp.server.workers", 0))
+
+        if workers:
+            server = PreforkServer(
+                self, host, port, workers=workers,
+                keepalive=float(self.config.get("webapp.server.keepalive", 5.0)),
+                graceful_timeout=float(self.config.get("webapp.server.graceful_timeout", 30.0))
+            )
+            server.serve() # Calls startup and shutdown
+            return
+
         if not self.__startup_called:
             self.startup()
 
@@ -92,57 +312,157 @@ class WsgiApp(BaseApp):
 
         exchange = self.create_exchange(environ)
 
+        timing = exchange.timing
+        admission = self.admission
+
         # Process request
-        try:
-            exchange.start()
-            self.handle_request(exchange)
-            exchange.finalize()
-        except Exception as ex: # pylint: disable=broad-except
-            self.handle_exception(ex, exchange)
+        if admission is not None and not admission.acquire():
+            self.handle_overloaded(exchange)
+        else:
+            try:
+                timing.begin("parse")
+                exchange.start()
+                self.handle_request(exchange)
+                timing.begin("finalize")
+                exchange.finalize()
+            except RequestTooLargeError:
+                self.handle_toolarge(exchange)
+            except RequestError as ex:
+                self.handle_badrequest(exchange, ex)
+            except Exception as ex: # pylint: disable=broad-except
+                self.handle_exception(ex, exchange)
+            finally:
+                if admission is not None:
+                    admission.release()
+
+        if self.metrics is not None:
+            self.metrics.record(exchange)
 
         # Return the response
         response = exchange.response
+        body = None
         try:
+            timing.begin("encode")
+            body = response.get_body(environ)
+            if self.compressor is not None:
+                body = self.compressor.compress(exchange, body)
+
+            if timing.enabled:
+                self.finish_timing(exchange)
+
             start_response(
                 response.get_status(),
                 response.get_headers()
             )
-
-            # Build return based on type
-            if isinstance(response.content, str):
-                return [response.content.encode("utf-8")]
-
-            if isinstance(response.content, bytes):
-                return [response.content]
-
-            return response.content
         except Exception as ex: # pylint: disable=broad-except
             self.handle_exception(ex)
+            if hasattr(body, "close"):
+                body.close()
+
             start_response(
                 "500 Internal Server Error",
                 [("Content-Type", "text/html")]
             )
-            return [
+            body = [
                 b"<html><body>"
                 b"<h1>Internal Server Error</h1>"
                 b"<p>An internal server error has occurred.</p>"
                 b"</body></html>"
             ]
 
+            # Logged as what was sent
+            response.status = 500
+            response.content_length = len(body[0])
+
+        if self.access_log is not None:
+            self.access_log.log(exchange)
+        return body
+
     def handle_request(self, exchange):
         """ This method gets called by __call__ to perform request handling. """
+        route = self.match_route(exchange)
+        if route is None:
+            return
+
+        handler = route.handler
+        if route.is_async:
+            handler = lambda exchange: asyncio.run(route.handler(exchange))
+
+        if self.profiler is None:
+            self.call_route(exchange, route, handler)
+        else:
+            self.profiler.run(
+                exchange, lambda exchange: self.call_route(exchange, route, handler)
+            )
+
+    def match_route(self, exchange):
+        """ Find the route of the exchange and set its parameters.
+            Return value is the Route, or None if there isn't one and the
+            response was already set.
+        """
+        exchange.timing.begin("routing")
         request = exchange.request
         method = request.method.upper()
-        path = request.path_info
 
-        # Find route
-        result = self.router.route(path, method=method)
-        if result is None:
+        (route, params, allowed) = self.router.match(request.path_info, method=method)
+        if route is not None:
+            exchange.route = route
+            if self.metrics is not None:
+                self.metrics.begin(route)
+            if params:
+                request.params = dict(params) # The router may cache params
+            return route
+
+        if not allowed:
             self.handle_notfound(exchange)
+        elif method == "OPTIONS":
+            self.handle_options(exchange, allowed)
         else:
-            (route, params) = result
-            request.params.update(params)
-            route(exchange)
+            self.handle_notallowed(exchange, allowed)
+
+        return None
+
+    def call_route(self, exchange, route, handler):
+        """ Call the synchronous handler of a route, using the response
+            cache if the route asks for it.
+        """
+        exchange.timing.begin("handler")
+
+        admission = self.admission
+        if admission is not None and not admission.acquire(route):
+            self.handle_overloaded(exchange)
+            return
+
+        try:
+            self.run_route(exchange, route, handler)
+        finally:
+            if admission is not None:
+                admission.release(route)
+
+    def run_route(self, exchange, route, handler):
+        """ Call the synchronous handler of an admitted route, using the
+            response cache if the route asks for it.
+        """
+        ttl = route.options.get("cache")
+        if ttl and self.response_cache is not None:
+            self.response_cache.handle(
+                exchange, handler, ttl, route.options.get("cache_vary", ())
+            )
+        else:
+            handler(exchange)
+
+    def finish_timing(self, exchange):
+        """ End the timing of an exchange before the response is started.
+            This adds the Server-Timing header if enabled and passes the
+            timing to the sink.
+        """
+        timing = exchange.timing
+        timing.end()
+
+        if self.timing_header:
+            exchange.response.headers["Server-Timing"] = timing.header()
+        if self.timing_sink is not None:
+            self.timing_sink(exchange, timing)
 
     def handle_exception(self, ex, exchange=None):
         """ Handle an exception. """
@@ -152,20 +472,12 @@ class WsgiApp(BaseApp):
         except ValueError:
             debug = False
 
-        # Get the traceback
-        tbcapture = io.StringIO()
-        traceback.print_exception(
-            etype=type(ex),
-            value=ex,
-            tb=ex.__traceback__,
-            file=tbcapture
+        # Write to the error log, the traceback is formatted when written
+        self._logger.error(
+            "Exception while handling a request",
+            exc_info=(type(ex), ex, ex.__traceback__)
         )
 
-        error_message = tbcapture.getvalue()
-
-        # Write to the error log
-        self._logger.error(error_message)
-
         # Write to the client
         if exchange is None:
             return
@@ -185,6 +497,9 @@ class WsgiApp(BaseApp):
                 )
                 return
 
+            error_message = "".join(
+                traceback.format_exception(type(ex), ex, ex.__traceback__)
+            )
             response.content = (
                 "<html><body>"
                 "<h1>Exception Occurred</h1>"
@@ -206,3 +521,56 @@ class WsgiApp(BaseApp):
         response.content = (
             "The requested page could not be found.  Please try again."
         )
+
+    def handle_toolarge(self, exchange):
+        """ Handle a request body over the configured limits. """
+        response = exchange.response
+        response.reset()
+
+        response.status = 413
+        response.content_type = "text/html"
+        response.content = (
+            "The request is larger than the server is willing to process."
+        )
+
+    def handle_badrequest(self, exchange, ex):
+        """ Handle a malformed request, such as an invalid body. """
+        response = exchange.response
+        response.reset()
+
+        response.status = 400
+        response.content_type = "text/html"
+        response.content = (
+            "The request could not be understood by the server: " + html.escape(str(ex))
+        )
+
+    def handle_overloaded(self, exchange):
+        """ Turn away a request when admission control is full. """
+        response = exchange.response
+        response.reset()
+
+        response.status = 503
+        response.content_type = "text/html"
+        response.headers["Retry-After"] = str(self.admission.retry_after)
+        response.content = (
+            "The server is too busy to handle the request.  Please try again later."
+        )
+
+    def handle_notallowed(self, exchange, allowed):
+        """ Handle a path that exists but not for the request method. """
+        response = exchange.response
+
+        response.status = 405
+        response.content_type = "text/html"
+        response.headers["Allow"] = ", ".join(sorted(allowed | {"OPTIONS"}))
+        response.content = (
+            "The requested method is not allowed for this page."
+        )
+
+    def handle_options(self, exchange, allowed):
+        """ Answer an OPTIONS request for a path without an OPTIONS route. """
+        response = exchange.response
+
+        response.status = 204
+        response.headers["Allow"] = ", ".join(sorted(allowed | {"OPTIONS"}))
+        response.content = b""
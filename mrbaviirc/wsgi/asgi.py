@@ -0,0 +1,354 @@
+""" ASGI adapter for the web application. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["AsgiAdapter"]
+
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import sys
+import threading
+
+from .content import StreamContent
+from .error import AppError, RequestError, RequestTooLargeError
+
+
+_DONE = object()
+
+
+class _AsgiInput:
+    """ The wsgi.input of an ASGI request.
+        The body is received as it is read.  Handlers in the thread pool use
+        read, async handlers use aread or async iteration.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._thread = threading.get_ident()
+        self._buffer = bytearray()
+        self._more = True
+
+    async def _fill(self):
+        """ Receive the next message of the body. """
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self._buffer.extend(message.get("body", b""))
+            self._more = message.get("more_body", False)
+        else:
+            # http.disconnect
+            self._more = False
+
+    async def aread(self, size=-1):
+        """ Read up to size bytes, or all if size is negative.
+            This returns as soon as some data is available.
+        """
+        buffer = self._buffer
+        if size < 0:
+            while self._more:
+                await self._fill()
+        else:
+            while self._more and not buffer:
+                await self._fill()
+
+        if size < 0 or size >= len(buffer):
+            data = bytes(buffer)
+            buffer.clear()
+        else:
+            data = bytes(buffer[:size])
+            del buffer[:size]
+
+        return data
+
+    def read(self, size=-1):
+        """ Read up to size bytes from a thread outside of the event loop. """
+        if threading.get_ident() == self._thread:
+            raise AppError(
+                "Async handlers must use await request.read_body() to read the body"
+            )
+
+        return asyncio.run_coroutine_threadsafe(self.aread(size), self._loop).result()
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self.aread(65536)
+            if not chunk:
+                return
+            yield chunk
+
+
+class AsgiAdapter:
+    """ Serve a WsgiApp over ASGI.
+        Requests go through the same routes, exchange, and error handling as
+        under WSGI.  Async handlers run on the event loop, and other handlers
+        run in a thread pool of at most threads threads so they don't block
+        it.  Request bodies are received as they are read and response
+        bodies are sent as they are produced.
+    """
+
+    def __init__(self, app, threads=32):
+        """ Initialize the adapter. """
+        self.app = app
+        self.threads = threads
+        self._pool = None
+
+    async def __call__(self, scope, receive, send):
+        """ Handle an ASGI connection. """
+        if scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.handle_lifespan(receive, send)
+        else:
+            raise AppError("Unsupported ASGI scope: " + scope["type"])
+
+    async def handle_lifespan(self, receive, send):
+        """ Call startup and shutdown of the app. """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    if not self.app.started:
+                        self.app.startup()
+                except Exception as ex: # pylint: disable=broad-except
+                    await send({"type": "lifespan.startup.failed", "message": str(ex)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                self.app.shutdown()
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def run_sync(self, fn, *args):
+        """ Call a function in the thread pool. """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.threads, "mrbaviirc.wsgi.asgi")
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args))
+
+    async def handle_http(self, scope, receive, send):
+        """ Handle an HTTP request. """
+        app = self.app
+        if not app.started:
+            raise AppError("startup must be called before requests are handled")
+
+        loop = asyncio.get_running_loop()
+        environ = self.create_environ(scope, _AsgiInput(receive, loop))
+        exchange = app.create_exchange(environ)
+        timing = exchange.timing
+        admission = app.admission
+
+        # Process request
+        if admission is not None and not await admission.aacquire():
+            app.handle_overloaded(exchange)
+        else:
+            try:
+                timing.begin("parse")
+                exchange.start()
+                route = app.match_route(exchange)
+                if route is not None:
+                    await self.call_route(exchange, route, loop)
+                timing.begin("finalize")
+                exchange.finalize()
+            except RequestTooLargeError:
+                app.handle_toolarge(exchange)
+            except RequestError as ex:
+                app.handle_badrequest(exchange, ex)
+            except Exception as ex: # pylint: disable=broad-except
+                app.handle_exception(ex, exchange)
+            finally:
+                if admission is not None:
+                    admission.release()
+
+        if app.metrics is not None:
+            app.metrics.record(exchange)
+
+        await self.send_response(exchange, send)
+
+    async def call_route(self, exchange, route, loop):
+        """ Call the handler of a route.
+            The route is admitted on the event loop, so a request waiting
+            for a slot never holds a thread of the pool.
+        """
+        app = self.app
+        exchange.timing.begin("handler")
+
+        admission = app.admission
+        if admission is not None and not await admission.aacquire(route):
+            app.handle_overloaded(exchange)
+            return
+
+        try:
+            await self.run_route(exchange, route, loop)
+        finally:
+            if admission is not None:
+                admission.release(route)
+
+    async def run_route(self, exchange, route, loop):
+        """ Call the handler of an admitted route. """
+        app = self.app
+        cached = route.options.get("cache") and app.response_cache is not None
+        if route.is_async and not cached:
+            await route.handler(exchange)
+            return
+
+        def run_async(exchange):
+            # The response cache calls it from the pool
+            future = asyncio.run_coroutine_threadsafe(route.handler(exchange), loop)
+            future.result()
+
+        handler = run_async if route.is_async else route.handler
+
+        profiler = app.profiler
+        if profiler is None:
+            await self.run_sync(app.run_route, exchange, route, handler)
+        else:
+            # Only handlers in the pool are profiled, the event loop runs
+            # other requests between the steps of async ones
+            await self.run_sync(
+                profiler.run, exchange,
+                lambda exchange: app.run_route(exchange, route, handler)
+            )
+
+    async def send_response(self, exchange, send):
+        """ Send the response of the exchange. """
+        app = self.app
+        response = exchange.response
+        body = None
+        try:
+            exchange.timing.begin("encode")
+            body = response.get_body(exchange.environ)
+            if app.compressor is not None:
+                body = app.compressor.compress(exchange, body)
+
+            if exchange.timing.enabled:
+                app.finish_timing(exchange)
+
+            status = response.get_status() # Checks the status is known
+            headers = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for (name, value) in response.get_headers()
+            ]
+        except Exception as ex: # pylint: disable=broad-except
+            app.handle_exception(ex)
+            await self._close(response, body)
+
+            body = (
+                b"<html><body>"
+                b"<h1>Internal Server Error</h1>"
+                b"<p>An internal server error has occurred.</p>"
+                b"</body></html>"
+            )
+
+            # Logged as what is sent
+            response.status = 500
+            response.content_length = len(body)
+            if app.access_log is not None:
+                app.access_log.log(exchange)
+
+            await send({
+                "type": "http.response.start",
+                "status": 500,
+                "headers": [(b"content-type", b"text/html")]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        if app.access_log is not None:
+            app.access_log.log(exchange)
+
+        await send({
+            "type": "http.response.start",
+            "status": int(status.partition(" ")[0]),
+            "headers": headers
+        })
+
+        if exchange.request is not None and exchange.request.method == "HEAD":
+            await self._close(response, body)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if isinstance(body, list):
+            await send({"type": "http.response.body", "body": b"".join(body)})
+            return
+
+        try:
+            if isinstance(response.content, StreamContent) and response.content.is_async:
+                async for chunk in body:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                # Iterate in the pool since reading a file or generating
+                # the next chunk may block
+                iterator = iter(body)
+                while True:
+                    chunk = await self.run_sync(next, iterator, _DONE)
+                    if chunk is _DONE:
+                        break
+                    if chunk:
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            await self._close(response, body)
+
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _close(self, response, body):
+        """ Close the body and content after sending. """
+        content = response.content
+        if isinstance(content, StreamContent) and content.is_async:
+            await content.aclose()
+        elif hasattr(body, "close"):
+            await self.run_sync(body.close)
+
+    @staticmethod
+    def create_environ(scope, wsgi_input):
+        """ Create a WSGI environ from an ASGI HTTP scope. """
+        server = scope.get("server") or ("localhost", None)
+        client = scope.get("client")
+
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            # Strings in the environ hold bytes as latin-1, the same as WSGI
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": client[0] if client else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": wsgi_input,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "wsgi.input_terminated": True, # Bodies without a length are read to the end
+            "asgi.scope": scope
+        }
+        if server[1] is not None:
+            environ["SERVER_PORT"] = str(server[1])
+
+        for (name, value) in scope.get("headers", ()):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = "HTTP_" + name
+
+            if name in environ:
+                # Join repeated headers the way a WSGI server would
+                sep = "; " if name == "HTTP_COOKIE" else ","
+                environ[name] += sep + value
+            else:
+                environ[name] = value
+
+        return environ
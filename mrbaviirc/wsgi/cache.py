@@ -0,0 +1,288 @@
+""" Caching helpers. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = [
+    "LruCache", "CacheBackend", "MemoryCacheBackend", "CachedResponse",
+    "ResponseCache"
+]
+
+
+from collections import OrderedDict
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+
+class LruCache:
+    """ A bounded, thread safe, least recently used cache. """
+
+    def __init__(self, maxsize):
+        """ Initialize the cache to hold at most maxsize entries. """
+        if maxsize < 1:
+            raise ValueError("LRU cache size must be at least 1")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """ Get an entry, marking it as recently used. """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """ Set an entry, evicting the least recently used if needed. """
+        with self._lock:
+            entries = self._entries
+            if key in entries:
+                entries.move_to_end(key)
+            elif len(entries) >= self.maxsize:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+            entries[key] = value
+
+    def pop(self, key, default=None):
+        """ Remove an entry and return it. """
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        """ Remove all entries.  The counters are kept. """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """ Return the cache counters as a dict. """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class CacheBackend:
+    """ Interface for a response cache store.
+        Keys are strings and values are CachedResponse objects, which can be
+        pickled for stores outside of the process.
+    """
+
+    def get(self, key):
+        """ Return the value for key or None. """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """ Store a value for at most ttl seconds. """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """ Remove a value. """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Remove all values. """
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """ An in process store backed by an LruCache. """
+
+    def __init__(self, maxsize=1024):
+        self._cache = LruCache(maxsize)
+
+    def get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+
+        (value, expires) = entry
+        if expires < time.time():
+            self._cache.pop(key)
+            return None
+
+        return value
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, (value, time.time() + ttl))
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        """ Return the counters of the underlying LruCache. """
+        return self._cache.stats()
+
+
+class CachedResponse:
+    """ A copy of a response that can be replayed. """
+
+    __slots__ = ("status", "headers", "content_type", "content", "expires")
+
+    def __init__(self, status, headers, content_type, content, expires):
+        self.status = status
+        self.headers = headers # (name, value) pairs
+        self.content_type = content_type
+        self.content = content
+        self.expires = expires # Fresh until this time.time()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for (name, value) in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def apply(self, response):
+        """ Copy into a Response. """
+        response.status = self.status
+        response.headers.extend(self.headers)
+        response.content_type = self.content_type
+        response.content = self.content
+
+
+class ResponseCache:
+    """ Cache complete responses of selected routes.
+        Entries are keyed by method, path, the sorted query string, and the
+        values of the vary request headers.  Once an entry expires, it is
+        kept for another stale_ttl seconds: one thread regenerates it while
+        the others keep getting the stale copy.  When there is no copy at
+        all, only one thread runs the handler for each key and the rest
+        wait up to wait_timeout seconds for it before running it themselves.
+    """
+
+    def __init__(self, backend=None, vary=(), stale_ttl=30, wait_timeout=10.0):
+        """ Initialize the response cache. """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.vary = tuple(vary)
+        self.stale_ttl = stale_ttl
+        self.wait_timeout = wait_timeout
+
+        self._lock = threading.Lock()
+        self._pending = {} # key: Event set once its handler returns
+
+    def make_key(self, exchange, vary=()):
+        """ Build the cache key of the exchange's request. """
+        request = exchange.request
+        environ = exchange.environ
+
+        query = urlencode(sorted(parse_qsl(request.query_string, keep_blank_values=True)))
+        parts = [request.method, request.script_name + request.path_info, query]
+        for header in self.vary + tuple(vary):
+            name = "HTTP_" + header.upper().replace("-", "_")
+            parts.append(header.lower() + "=" + environ.get(name, ""))
+
+        return "\n".join(parts)
+
+    def handle(self, exchange, handler, ttl, vary=()):
+        """ Serve the exchange from the cache or by calling the handler. """
+        if exchange.request.method not in ("GET", "HEAD"):
+            handler(exchange)
+            return
+
+        key = self.make_key(exchange, vary)
+        entry = self.backend.get(key)
+        if entry is not None and entry.expires > time.time():
+            entry.apply(exchange.response)
+            return
+
+        pending = self._begin(key)
+        if entry is not None:
+            # Stale: regenerate unless another thread already is
+            if pending is not None:
+                entry.apply(exchange.response)
+                return
+
+            try:
+                self._generate(exchange, handler, key, ttl)
+            finally:
+                self._end(key)
+            return
+
+        if pending is not None:
+            # Missing: wait for the thread already generating it
+            if pending.wait(self.wait_timeout):
+                entry = self.backend.get(key)
+                if entry is not None and entry.expires > time.time():
+                    entry.apply(exchange.response)
+                    return
+
+            # Not cacheable, or taking too long
+            self._generate(exchange, handler, key, ttl)
+            return
+
+        try:
+            # Another thread may have filled it since the lookup
+            entry = self.backend.get(key)
+            if entry is not None and entry.expires > time.time():
+                entry.apply(exchange.response)
+                return
+
+            self._generate(exchange, handler, key, ttl)
+        finally:
+            self._end(key)
+
+    def _begin(self, key):
+        """ Mark key as being generated by this thread and return None, or
+            return the Event of the thread that already is.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = threading.Event()
+            return pending
+
+    def _end(self, key):
+        """ Wake the threads waiting for key to be generated. """
+        with self._lock:
+            pending = self._pending.pop(key)
+        pending.set()
+
+    def _generate(self, exchange, handler, key, ttl):
+        """ Call the handler and store the response if it can be cached. """
+        handler(exchange)
+
+        response = exchange.response
+        content = response.content
+        if response.status != 200 or response.cookies or \
+                "Set-Cookie" in response.headers or \
+                not isinstance(content, (str, bytes)):
+            return
+
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        entry = CachedResponse(
+            response.status,
+            list(response.headers.items()),
+            response.content_type,
+            content,
+            time.time() + ttl
+        )
+        self.backend.set(key, entry, ttl + self.stale_ttl)
@@ -0,0 +1,175 @@
+""" Response compression. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["Compressor"]
+
+
+import hashlib
+import zlib
+
+from .cache import LruCache
+from .content import FileContent
+from .headers import parse_accept
+
+
+# wbits for zlib.compressobj
+_ENCODINGS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS
+}
+
+
+class _CompressIterator:
+    """ Compress the chunks of a body as they are produced. """
+
+    def __init__(self, body, compressobj):
+        self.body = body
+        self.compressobj = compressobj
+
+    def __iter__(self):
+        compress = self.compressobj.compress
+        for chunk in self.body:
+            chunk = compress(chunk)
+            if chunk:
+                yield chunk
+
+        yield self.compressobj.flush()
+
+    async def __aiter__(self):
+        compress = self.compressobj.compress
+        async for chunk in self.body:
+            chunk = compress(chunk)
+            if chunk:
+                yield chunk
+
+        yield self.compressobj.flush()
+
+    def close(self):
+        close = getattr(self.body, "close", None)
+        if close is not None:
+            close()
+
+
+class Compressor:
+    """ Compress response bodies for clients that accept it.
+        Bytes and str content is compressed at once, and the results can be
+        kept in an LRU cache so repeated identical responses are only
+        compressed once.  Streamed content is compressed chunk by chunk.
+        Small bodies, content types that don't benefit, and responses that
+        already have a Content-Encoding are sent as is.
+    """
+
+    COMPRESSIBLE_TYPES = frozenset((
+        "application/json", "application/javascript", "application/xml",
+        "application/xhtml+xml", "image/svg+xml"
+    ))
+
+    def __init__(self, min_size=1024, level=6, cache_size=0, cache_max_item=1048576):
+        """ Initialize the compressor. """
+        self.min_size = min_size
+        self.level = level
+        self.cache_max_item = cache_max_item
+        self._cache = LruCache(cache_size) if cache_size > 0 else None
+
+    def is_compressible(self, content_type):
+        """ Test if a content type is worth compressing. """
+        if not content_type:
+            return False
+
+        content_type = content_type.partition(";")[0].strip().lower()
+        return (
+            content_type.startswith("text/") or
+            content_type in self.COMPRESSIBLE_TYPES or
+            content_type.endswith("+json") or
+            content_type.endswith("+xml")
+        )
+
+    def compress(self, exchange, body):
+        """ Compress the WSGI body of the exchange's response if possible.
+            Return value is the body to send.  The response headers and
+            content_length are updated to match.
+        """
+        response = exchange.response
+        status = response.status
+        if not response.compress or not (200 <= status < 300 or status == 304) or \
+                not self.is_compressible(response.content_type):
+            return body
+
+        # The same Vary and ETag whether this response is compressed or not,
+        # such as for a small body or a 304 of what would be compressed
+        self._add_vary(response)
+        if status in (204, 206) or isinstance(response.content, FileContent) or \
+                "Content-Encoding" in response.headers:
+            return body
+
+        encoding = self._negotiate(exchange.environ.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is None:
+            return body
+
+        etag = response.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            # The compressed body isn't byte for byte the same representation
+            response.headers["ETag"] = "W/" + etag
+
+        length = response.content_length
+        if status == 304 or (length is not None and length < self.min_size):
+            return body
+
+        response.headers["Content-Encoding"] = encoding
+        if isinstance(body, list) and len(body) == 1 and isinstance(body[0], bytes):
+            data = self._compress_bytes(encoding, body[0])
+            response.content_length = len(data)
+            return [data]
+
+        response.content_length = None
+        return _CompressIterator(body, self._compressobj(encoding))
+
+    def stats(self):
+        """ Return the counters of the compressed bytes cache. """
+        return self._cache.stats() if self._cache is not None else None
+
+    def _compressobj(self, encoding):
+        return zlib.compressobj(self.level, zlib.DEFLATED, _ENCODINGS[encoding])
+
+    def _compress_bytes(self, encoding, data):
+        """ Compress bytes, using the cache if enabled. """
+        cache = self._cache
+        if cache is None or len(data) > self.cache_max_item:
+            compressobj = self._compressobj(encoding)
+            return compressobj.compress(data) + compressobj.flush()
+
+        key = (encoding, hashlib.sha1(data).digest())
+        compressed = cache.get(key)
+        if compressed is None:
+            compressobj = self._compressobj(encoding)
+            compressed = compressobj.compress(data) + compressobj.flush()
+            cache.set(key, compressed)
+
+        return compressed
+
+    @staticmethod
+    def _negotiate(header):
+        """ Pick the accepted encoding with the highest quality. """
+        accepted = parse_accept(header)
+        best = None
+        for encoding in _ENCODINGS:
+            quality = accepted.get(encoding, accepted.get("*", 0))
+            if quality > 0 and (best is None or quality > best[1]):
+                best = (encoding, quality)
+
+        return best[0] if best is not None else None
+
+    @staticmethod
+    def _add_vary(response):
+        """ Add Accept-Encoding to the Vary header. """
+        vary = response.headers.get("Vary")
+        if not vary:
+            response.headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            response.headers["Vary"] = vary + ", Accept-Encoding"
@@ -0,0 +1,164 @@
+""" Streaming and file response content. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["Content", "StreamContent", "FileContent"]
+
+
+import os
+
+
+class Content:
+    """ Base for response content that isn't a plain str or bytes. """
+
+    def get_length(self):
+        """ Return the length in bytes if known, else None. """
+        return None
+
+    def get_iterable(self, environ):
+        """ Return the WSGI iterable for the content. """
+        raise NotImplementedError
+
+
+class StreamContent(Content):
+    """ Content generated by an iterable of str or bytes chunks.
+        The chunks are sent as they are produced.  If the iterable has a
+        close method it is called when the server is done with the response.
+        Under ASGI, the iterable can also be an async iterable.
+    """
+
+    def __init__(self, iterable, length=None, encoding="utf-8"):
+        """ Initialize the stream. """
+        self.iterable = iterable
+        self.length = length
+        self.encoding = encoding
+
+    def get_length(self):
+        return self.length
+
+    def get_iterable(self, environ):
+        return self
+
+    def __iter__(self):
+        encoding = self.encoding
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(encoding)
+            if chunk:
+                yield chunk
+
+    async def __aiter__(self):
+        encoding = self.encoding
+        async for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(encoding)
+            if chunk:
+                yield chunk
+
+    @property
+    def is_async(self):
+        """ Whether the iterable is an async iterable. """
+        return hasattr(self.iterable, "__aiter__")
+
+    def close(self):
+        """ Close the underlying iterable. """
+        close = getattr(self.iterable, "close", None)
+        if close is not None:
+            close()
+
+    async def aclose(self):
+        """ Close the underlying async iterable. """
+        aclose = getattr(self.iterable, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        else:
+            self.close()
+
+
+class _FileIterator:
+    """ Read a file in blocks for servers without wsgi.file_wrapper. """
+
+    def __init__(self, file, length, block_size, owned):
+        self.file = file
+        self.remaining = length
+        self.block_size = block_size
+        self.owned = owned
+
+    def __iter__(self):
+        read = self.file.read
+        block_size = self.block_size
+        while self.remaining > 0:
+            block = read(min(block_size, self.remaining))
+            if not block:
+                break
+
+            self.remaining -= len(block)
+            yield block
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+class FileContent(Content):
+    """ Content read from a file.
+        The file can be a filename or a binary file object.  When the rest of
+        the file is sent and the server provides wsgi.file_wrapper, it is
+        used so the server can send the file without passing it through
+        Python.  Otherwise the file is read in blocks.  A file opened from a
+        filename is always closed, a file object only if close is set.
+    """
+
+    def __init__(self, file, offset=0, length=None, block_size=65536, close=True):
+        """ Initialize the file content. """
+        self.file = file
+        self.offset = offset
+        self.block_size = block_size
+        self.close_file = close
+
+        if length is None:
+            if isinstance(file, str):
+                size = os.stat(file).st_size
+            else:
+                size = os.fstat(file.fileno()).st_size
+            length = max(0, size - offset)
+        self.length = length
+
+    def get_length(self):
+        return self.length
+
+    def get_iterable(self, environ):
+        if isinstance(self.file, str):
+            file = open(self.file, "rb")
+            owned = True
+        else:
+            file = self.file
+            owned = self.close_file
+
+        try:
+            if self.offset:
+                file.seek(self.offset)
+
+            # file_wrapper closes the file when the server is done, so it is
+            # only used for files we own
+            wrapper = environ.get("wsgi.file_wrapper")
+            if owned and wrapper is not None and self._to_end(file):
+                return wrapper(file, self.block_size)
+        except BaseException:
+            if owned:
+                file.close()
+            raise
+
+        return _FileIterator(file, self.length, self.block_size, owned)
+
+    def _to_end(self, file):
+        """ Test if the content is everything left in the file. """
+        try:
+            return os.fstat(file.fileno()).st_size == self.offset + self.length
+        except (AttributeError, OSError, ValueError):
+            return False
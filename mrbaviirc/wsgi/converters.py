@@ -0,0 +1,155 @@
+""" Converters for typed route variables. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = [
+    "Converter", "StringConverter", "IntConverter", "FloatConverter",
+    "UuidConverter", "SlugConverter", "PathConverter", "DEFAULT_CONVERTERS"
+]
+
+
+import decimal
+import math
+import string
+import uuid
+
+
+def _is_digits(value):
+    """ Test for a non-empty string of ASCII digits. """
+    return value.isdigit() and value.isascii()
+
+
+class Converter:
+    """ Convert a route variable to and from a python value.
+
+        The regex is used when the variable shares a path component with
+        other text.  When a variable is the whole component and native is
+        set, only to_python is used to match it, so it must raise ValueError
+        for anything the regex wouldn't match.
+    """
+
+    regex = "[^/]+"
+    matchall = False
+    native = False
+
+    def to_python(self, value):
+        """ Convert a matched string to a python value. """
+        return value
+
+    def to_url(self, value):
+        """ Convert a python value back to a string for a path. """
+        return str(value)
+
+
+class StringConverter(Converter):
+    """ Any non-empty path component.  This is the default. """
+
+    native = True
+
+    def to_python(self, value):
+        if not value:
+            raise ValueError("Empty value")
+
+        return value
+
+
+class IntConverter(Converter):
+    """ An optionally negative integer. """
+
+    regex = "-?\\d+"
+    native = True
+
+    def to_python(self, value):
+        digits = value[1:] if value[:1] == "-" else value
+        if not _is_digits(digits):
+            raise ValueError("Not an integer: " + value)
+
+        return int(value)
+
+    def to_url(self, value):
+        return str(int(value))
+
+
+class FloatConverter(Converter):
+    """ An optionally negative decimal number. """
+
+    regex = "-?(?:\\d+\\.?\\d*|\\.\\d+)"
+    native = True
+
+    def to_python(self, value):
+        number = value[1:] if value[:1] == "-" else value
+        (whole, _, fraction) = number.partition(".")
+        if not (whole or fraction) or \
+                (whole and not _is_digits(whole)) or \
+                (fraction and not _is_digits(fraction)):
+            raise ValueError("Not a number: " + value)
+
+        return float(value)
+
+    def to_url(self, value):
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError("Not a finite number: " + repr(value))
+
+        # The shortest digits that round trip, but never with an exponent
+        return format(decimal.Decimal(repr(value)), "f")
+
+
+class UuidConverter(Converter):
+    """ A UUID in the standard hyphenated form. """
+
+    regex = (
+        "[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+        "[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    )
+    native = True
+
+    _CHARS = frozenset(string.hexdigits + "-")
+
+    def to_python(self, value):
+        # uuid.UUID would also allow the "+" and "_" of int(value, 16)
+        if len(value) != 36 or \
+                value[8] != "-" or value[13] != "-" or \
+                value[18] != "-" or value[23] != "-" or \
+                value.count("-") != 4 or not self._CHARS.issuperset(value):
+            raise ValueError("Not a UUID: " + value)
+
+        return uuid.UUID(value)
+
+
+class SlugConverter(Converter):
+    """ Letters, digits, hyphens and underscores. """
+
+    regex = "[-a-zA-Z0-9_]+"
+    native = True
+
+    _CHARS = frozenset(string.ascii_letters + string.digits + "-_")
+
+    def to_python(self, value):
+        if not value or not self._CHARS.issuperset(value):
+            raise ValueError("Not a slug: " + value)
+
+        return value
+
+
+class PathConverter(Converter):
+    """ The remainder of the path, including any slashes. """
+
+    regex = ".*" # Note that path can match blank elements as well
+    matchall = True
+    native = True
+
+
+DEFAULT_CONVERTERS = {
+    "string": StringConverter(),
+    "int": IntConverter(),
+    "float": FloatConverter(),
+    "uuid": UuidConverter(),
+    "slug": SlugConverter(),
+    "path": PathConverter()
+}
@@ -6,7 +6,8 @@ __license__ = "Apache License 2.0"
 
 
 __all__ = [
-    "Error", "AppError", "RouteError", "RequestError"
+    "Error", "AppError", "ConfigError", "RouteError", "RequestError",
+    "RequestTooLargeError"
 ]
 
 
@@ -26,4 +27,8 @@ class RouteError(Error):
 class RequestError(Error):
     pass
 
+class RequestTooLargeError(RequestError):
+    """ A request body is over one of the configured limits. """
+    pass
+
 
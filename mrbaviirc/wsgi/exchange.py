@@ -10,35 +10,86 @@ __license__ = "Apache License 2.0"
 __all__ = ["Exchange", "Request", "Response"]
 
 
-import cgi
+import hashlib
+import io
 from http.cookies import SimpleCookie #, CookieError
+import mimetypes
 import tempfile
 import time
 from urllib.parse import urlsplit
 from urllib.parse import parse_qs
 
-from mrbaviirc.common.functools import lazy_property
+from .content import Content, FileContent, StreamContent
+from .error import AppError, RequestError, RequestTooLargeError
+from .headers import EnvironHeaders, Headers, etag_matches
+from .multipart import MultipartParser, parse_header
+from .timing import NULL_TIMING, Timing
 
+# Use a faster JSON decoder if one is installed
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    try:
+        from ujson import loads as _json_loads
+    except ImportError:
+        from json import loads as _json_loads
 
-class _FieldStorage(cgi.FieldStorage):
-    """ Control where the temp files are created. """
 
-    def __init__(self, *args, **kwargs):
-        tmpdir = kwargs.pop("tmpdir", None)
-        cgi.FieldStorage.__init__(self, *args, **kwargs)
-        self.__tmpdir = tmpdir
+_BODY_METHODS = frozenset(("POST", "PUT", "PATCH"))
 
-    def make_file(self):
-        tmpdir = self.__dict__.get("_FieldStorage__tmpdir", None)
-        if self._binary_file:
-            return tempfile.TemporaryFile("wb+", dir=tmpdir)
 
-        return tempfile.TemporaryFile(
-            "w+", dir=tmpdir, encoding=self.encoding, newline="\n"
-        )
+class _slot_property: # pylint: disable=invalid-name
+    """ Like lazy_property, but for classes with __slots__.
+        The value is kept in the slot "_lazy_" + name (without any leading
+        underscore), which the class must declare.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.slot = None
+        self.__doc__ = fn.__doc__
+
+    def __set_name__(self, owner, name):
+        self.slot = owner.__dict__["_lazy_" + name.lstrip("_")]
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        try:
+            return self.slot.__get__(instance, owner)
+        except AttributeError:
+            value = self.fn(instance)
+            self.slot.__set__(instance, value)
+            return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+class RequestLimits:
+    """ Limits on request bodies.  A limit of 0 means no limit. """
+
+    __slots__ = ("max_body", "max_field_size", "max_file_size", "max_fields")
+
+    def __init__(self, max_body=0, max_field_size=0, max_file_size=0, max_fields=0):
+        self.max_body = max_body # Total body size
+        self.max_field_size = max_field_size # Size of each non-file field
+        self.max_file_size = max_file_size # Size of each uploaded file
+        self.max_fields = max_fields # Number of fields and files
+
+    @classmethod
+    def from_config(cls, config):
+        """ Create the limits from the webapp.request.* config. """
+        return cls(*(
+            int(config.get("webapp.request." + name, 0) or 0)
+            for name in cls.__slots__
+        ))
 
 
 class _FileInfo:
+    __slots__ = ("file", "filename")
+
     def __init__(self, file, filename):
         self.file = file # The file object for reading
         self.filename = filename # Filename on upload
@@ -47,18 +98,27 @@ class _FileInfo:
 class Request:
     """ Represent a request. """
 
+    __slots__ = (
+        "exchange", "_body_read",
+        "wsgi_multithreaded", "wsgi_multiprocess", "wsgi_run_once", "wsgi_input",
+        "scheme", "request_uri", "method", "path_info", "script_name",
+        "query_string", "user_agent", "remote_addr", "content_type",
+        "content_length",
+        "_lazy_params", "_lazy_userdata", "_lazy_headers", "_lazy_cookies", "_lazy_get",
+        "_lazy_post", "_lazy_files", "_lazy_host", "_lazy_domain",
+        "_lazy_port", "_lazy_host_info", "_lazy_body", "_lazy_json",
+        "_lazy_form"
+    )
+
     def __init__(self, exchange):
         """ Initialize the request"""
         self.exchange = exchange
 
         environ = exchange.environ
 
-        self.cookies = {} # name:value pairs for cookies
-        self.get = {} # name: [value, value] GET data
-        self.post = {} # name: [value, value] POST data
-        self.params = {} # Parsed from router
-        self.userdata = {} # Customer parameters to pass around
-        self.files = {} # Parsed by upload
+        # params, userdata, headers, cookies, get, post, files, host, domain, and port
+        # are created on first access
+        self._body_read = False # Set once the body has been consumed
 
         # wsgi specific information
         self.wsgi_multithreaded = environ.get("wsgi.multithread", "")
@@ -77,100 +137,320 @@ class Request:
         self.user_agent = environ.get("HTTP_USER_AGENT", "")
         self.remote_addr = environ.get("REMOTE_ADDR", "")
 
-        if self.method == "POST":
+        if self.method in _BODY_METHODS:
             self.content_type = environ.get(
                 "CONTENT_TYPE",
                 "application/x-www-form-urlencoded"
             )
-            try:
-                self.content_length = int(environ.get("CONTENT_LENGTH", 0))
-            except ValueError:
-                self.content_length = 0
+            length = environ.get("CONTENT_LENGTH")
+            if not length and environ.get("wsgi.input_terminated", False):
+                # Such as chunked ASGI bodies, read until the input ends
+                self.content_length = None
+            else:
+                try:
+                    self.content_length = int(length or 0)
+                except ValueError:
+                    self.content_length = 0
         else:
             self.content_type = ""
             self.content_length = 0
 
-        # Determine host, domain, and port
+        # Reject oversized bodies before anything reads them
+        limits = exchange.app.request_limits
+        if limits.max_body and (self.content_length or 0) > limits.max_body:
+            raise RequestTooLargeError("Request body too large")
+
+    @_slot_property
+    def params(self):
+        """ Parameters parsed from the route """
+        return {}
+
+    @_slot_property
+    def userdata(self):
+        """ Custom parameters to pass around """
+        return {}
+
+    @_slot_property
+    def headers(self):
+        """ A read-only, case-insensitive view of the request headers """
+        return EnvironHeaders(self.exchange.environ)
+
+    @_slot_property
+    def cookies(self):
+        """ name:value pairs for cookies """
+        cookies = self.exchange.environ.get("HTTP_COOKIE", "")
+        if cookies is not None:
+            cookies = SimpleCookie(cookies)
+            return {i: cookies[i].value for i in cookies}
+
+        return {}
+
+    @_slot_property
+    def get(self):
+        """ name: [value, value] GET data """
+        return parse_qs(self.query_string)
+
+    @_slot_property
+    def post(self):
+        """ name: [value, value] POST, PUT, or PATCH form data """
+        return self._form[0]
+
+    @_slot_property
+    def files(self):
+        """ name: [fileinfo, fileinfo] uploaded files """
+        return self._form[1]
+
+    @_slot_property
+    def host(self):
+        """ The host and port if given. """
+        return self._host_info[0]
+
+    @_slot_property
+    def domain(self):
+        """ The host without the port. """
+        return self._host_info[1]
+
+    @_slot_property
+    def port(self):
+        """ The port, from the host or the scheme. """
+        return self._host_info[2]
+
+    @_slot_property
+    def _host_info(self):
+        """ Determine host, domain, and port. """
+        environ = self.exchange.environ
+
         host = environ.get("HTTP_HOST", None)
         if host is not None:
             # Get host, domain, and port (if possible) from host
-            self.host = host
-
             split = urlsplit("//{0}".format(host))
-            self.domain = split.hostname
+            domain = split.hostname
             if split.port:
-                self.port = int(split.port)
+                port = int(split.port)
             else:
                 # port wasn't specified in host, determine from scheme
-                self.port = {"http": 80, "https": 443}.get(self.scheme)
+                port = {"http": 80, "https": 443}.get(self.scheme)
         else:
             # Host not specified, build from parts
-            self.domain = environ.get("SERVER_NAME")
+            domain = environ.get("SERVER_NAME")
             port = environ.get("SERVER_PORT", None)
             if port is not None:
-                self.port = int(port)
-                self.host = "{0}:{1}".format(self.domain, self.port)
+                port = int(port)
+                host = "{0}:{1}".format(domain, port)
             else:
-                self.port = {"http": 80, "https": 443}.get(self.scheme)
-                self.host = self.domain # Leave without :port
-
-        # Parse our query string
-        self.get = parse_qs(self.query_string)
+                port = {"http": 80, "https": 443}.get(self.scheme)
+                host = domain # Leave without :port
+
+        return (host, domain, port)
+
+    @_slot_property
+    def body(self):
+        """ The raw request body as bytes. """
+        if self._body_read:
+            raise AppError("Request body has already been read")
+        self._body_read = True
+
+        chunks = []
+        if self.content_length is None:
+            size = 0
+            while True:
+                chunk = self.wsgi_input.read(65536)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                self._check_streamed(size)
+                chunks.append(chunk)
+
+            return b"".join(chunks)
+
+        # Read exactly content_length bytes even if the input returns less
+        remaining = self.content_length
+        while remaining > 0:
+            chunk = self.wsgi_input.read(remaining)
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        return b"".join(chunks)
+
+    def _check_streamed(self, size):
+        """ Check the size read so far of a body without a length. """
+        max_body = self.exchange.app.request_limits.max_body
+        if max_body and size > max_body:
+            raise RequestTooLargeError("Request body too large")
+
+    async def read_body(self):
+        """ Read the body without blocking the event loop.
+            Async handlers under ASGI must call this before using body, json,
+            post, or files.  Elsewhere it simply returns body.
+        """
+        aread = getattr(self.wsgi_input, "aread", None)
+        if aread is None:
+            return self.body
+
+        try:
+            return self._lazy_body
+        except AttributeError:
+            pass
+
+        if self._body_read:
+            raise AppError("Request body has already been read")
+        self._body_read = True
+
+        chunks = []
+        if self.content_length is None:
+            size = 0
+            while True:
+                chunk = await aread(65536)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                self._check_streamed(size)
+                chunks.append(chunk)
+        else:
+            remaining = self.content_length
+            while remaining > 0:
+                chunk = await aread(remaining)
+                if not chunk:
+                    break
+
+                chunks.append(chunk)
+                remaining -= len(chunk)
+
+        self.body = b"".join(chunks)
+        return self.body
+
+    @_slot_property
+    def json(self):
+        """ The decoded JSON body, or None if the body isn't JSON. """
+        (ctype, _) = parse_header(self.content_type)
+        if ctype != "application/json" and not ctype.endswith("+json"):
+            return None
+
+        body = self.body
+        if not body:
+            return None
+
+        try:
+            return _json_loads(body)
+        except ValueError:
+            raise RequestError("Invalid JSON request body")
+
+    @_slot_property
+    def _form(self):
+        """ Parse the form data into (post, files). """
+        if self.method in _BODY_METHODS:
+            return self._handle_post()
+
+        return ({}, {})
+
+    def stream_form(self):
+        """ Iterate the parts of a multipart body without buffering them.
+            Each part is a MultipartPart whose data must be read or saved
+            before moving to the next.  After this, post and files can't be
+            used for the request.
+        """
+        (ctype, params) = parse_header(self.content_type)
+        if self.method not in _BODY_METHODS or ctype != "multipart/form-data":
+            raise RequestError("Request does not have a multipart body")
+
+        return iter(self._multipart_parser(params.get("boundary")))
+
+    def _multipart_parser(self, boundary):
+        """ Create a parser for the multipart body. """
+        app = self.exchange.app
+        chunk_size = int(app.config.get("webapp.upload.chunk_size", 65536))
 
-        # Parse our cookies if any
-        cookies = environ.get("HTTP_COOKIE", "")
-        if cookies is not None:
-            cookies = SimpleCookie(cookies)
-            self.cookies = {i: cookies[i].value for i in cookies}
+        # Parse from memory if read_body already read it
+        try:
+            body = self._lazy_body
+        except AttributeError:
+            pass
         else:
-            self.cookies = {}
+            return MultipartParser(
+                io.BytesIO(body), boundary, len(body), chunk_size, app.request_limits
+            )
 
-        # Handle POST request
-        if self.method == "POST":
-            self._handle_post()
+        if self._body_read:
+            raise AppError("Request body has already been read")
+        self._body_read = True
+
+        return MultipartParser(
+            self.wsgi_input, boundary, self.content_length, chunk_size,
+            app.request_limits
+        )
 
     def _handle_post(self):
-        """ Handle any POST data. """
-        app = self.exchange.app
-        environ = self.exchange.environ
+        """ Handle any POST, PUT, or PATCH form data. """
+        post = {}
+        files = {}
+
+        (ctype, params) = parse_header(self.content_type)
+        if ctype == "application/x-www-form-urlencoded":
+            limits = self.exchange.app.request_limits
+            try:
+                post = parse_qs(
+                    self.body.decode(params.get("charset", "utf-8"), "replace"),
+                    keep_blank_values=True,
+                    max_num_fields=limits.max_fields or None
+                )
+            except ValueError:
+                raise RequestTooLargeError("Too many form fields")
+
+            if limits.max_field_size:
+                for values in post.values():
+                    if any(len(value) > limits.max_field_size for value in values):
+                        raise RequestTooLargeError("Form field too large")
+
+            return (post, files)
 
-        tmpdir = app.config.get("webapp.upload.tmpdir", None)
-        postenv = environ.copy()
-        postenv["QUERY_STRING"] = "" # Don't want POST getting fields from query string
-        form = _FieldStorage(fp=self.wsgi_input, environ=postenv, keep_blank_values=True, tmpdir=tmpdir)
+        if ctype != "multipart/form-data":
+            return (post, files)
 
-        # Process each item.  In our data, we want to store everything as a list
-        for key in form.keys():
-            if key is None:
+        config = self.exchange.app.config
+        tmpdir = config.get("webapp.upload.tmpdir", None)
+        memory_limit = int(config.get("webapp.upload.memory_limit", 1048576))
+
+        # Values are kept in memory, so without a field size limit they
+        # are limited to the memory limit
+        field_limit = self.exchange.app.request_limits.max_field_size or memory_limit
+
+        # In our data, we want to store everything as a list
+        for part in self._multipart_parser(params.get("boundary")):
+            if part.name is None:
                 continue
 
-            items = form[key]
-            if not isinstance(items, (list, tuple)):
-                items = [items]
-
-            for item in items:
-                if item.file and item.filename:
-                    # cgi.FieldStorage create a file for everything it seems, even
-                    # for regular non-file parameters, so we only treat items with
-                    # a filename value as a file.
-
-                    item.file.seek(0)
-                    fileslist = self.files.setdefault(item.name, [])
-                    fileslist.append(_FileInfo(item.file, item.filename))
-                else:
-                    # Value
-                    valuelist = self.post.setdefault(item.name, [])
-                    value = item.value
-                    # I think cgi.FieldStorage already decodes the bytes, just to be sure
-                    if isinstance(value, bytes):
-                        value = value.decode("utf-8") # TODO - get encoding from request
-                    if value is not None:
-                        valuelist.append(str(value))
+            if part.filename:
+                # Only items with a filename value are treated as a file. Small
+                # files stay in memory and larger ones are spooled to disk.
+                file = tempfile.SpooledTemporaryFile(
+                    max_size=memory_limit, mode="w+b", dir=tmpdir
+                )
+                part.save(file)
+                file.seek(0)
+
+                fileslist = files.setdefault(part.name, [])
+                fileslist.append(_FileInfo(file, part.filename))
+            else:
+                # Value
+                valuelist = post.setdefault(part.name, [])
+                valuelist.append(part.read(field_limit).decode(part.charset, "replace"))
+
+        return (post, files)
 
 
 class Response:
     """ Represent a response to a request. """
 
+    __slots__ = (
+        "exchange", "status", "_headers", "_cookies", "content_type",
+        "content_length", "compress", "content"
+    )
+
     STATUS_CODES = {
         100: "Continue",
         101: "Switching Protocol",
@@ -235,6 +515,11 @@ class Response:
         511: "Network Authentication Required"
     }
 
+    STATUS_LINES = {
+        code: "{0} {1}".format(code, reason)
+        for (code, reason) in STATUS_CODES.items()
+    }
+
     def __init__(self, exchange):
         """ Initialize the response. """
         self.exchange = exchange
@@ -244,37 +529,115 @@ class Response:
         """ Reset the response. """
         self.status = 500 # If not set, default to server error
 
-        self.headers = {}
-        self.cookies = {}
+        self._headers = None # Created on first access
+        self._cookies = None
         self.content_type = None
         self.content_length = None
+        self.compress = True # Allow the app to compress the content
 
         self.content = ()
 
-    def get_headers(self):
-        """ Get the headers of the response. """
-        headers = []
-        if self.content_type:
-            headers.append(("Content-Type", self.content_type))
-
-        for (name, value) in self.headers.items():
-            headers.append((name, value))
+    @property
+    def headers(self):
+        """ The Headers of the response """
+        if self._headers is None:
+            self._headers = Headers()
+        return self._headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value if isinstance(value, Headers) else Headers(value)
+
+    @property
+    def cookies(self):
+        """ name: value cookies to set, each sent as a Set-Cookie header """
+        if self._cookies is None:
+            self._cookies = {}
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, value):
+        self._cookies = value
+
+    def stream(self, iterable, content_type=None, length=None):
+        """ Send the chunks of an iterable as they are produced. """
+        if content_type is not None:
+            self.content_type = content_type
+        self.content = StreamContent(iterable, length)
+
+    def send_file(self, file, content_type=None, offset=0, length=None):
+        """ Send a file by name or binary file object.
+            The content type is guessed from a filename if not given.
+        """
+        if content_type is None and isinstance(file, str):
+            content_type = mimetypes.guess_type(file)[0] or "application/octet-stream"
+        if content_type is not None:
+            self.content_type = content_type
+        self.content = FileContent(file, offset, length)
+
+    def get_body(self, environ):
+        """ Get the WSGI iterable of the content.
+            This also sets content_length when the length is known.
+        """
+        content = self.content
+
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        if isinstance(content, bytes):
+            self.content_length = len(content)
+            return [content]
+
+        if isinstance(content, Content):
+            length = content.get_length()
+            if length is not None:
+                self.content_length = length
+            return content.get_iterable(environ)
+
+        return content
 
-        return headers
+    def get_headers(self):
+        """ Get the headers of the response.
+            Content-Type, Content-Length, and the cookies are added to the
+            response headers, whose list of pairs is returned as is.
+        """
+        headers = self.headers
+        if self.content_type and "Content-Type" not in headers:
+            headers.add("Content-Type", self.content_type)
+
+        # No Content-Length for responses that can't have a body
+        if self.content_length is not None and self.status >= 200 and \
+                self.status not in (204, 304) and "Content-Length" not in headers:
+            headers.add("Content-Length", str(self.content_length))
+
+        if self._cookies:
+            cookies = SimpleCookie()
+            for (name, value) in self._cookies.items():
+                cookies[name] = value
+                headers.add("Set-Cookie", cookies[name].OutputString())
+            self._cookies = None # Only sent once
+
+        return headers.items()
 
     def get_status(self):
         """ Get the status line of the response. """
-        return "{0} {1}".format(str(self.status), str(self.STATUS_CODES[self.status]))
+        return self.STATUS_LINES[self.status]
 
 
 class Exchange:
     """ An exchange is just a request and response pair. """
 
+    __slots__ = (
+        "app", "environ", "timer", "timing", "route", "response", "request"
+    )
+
     def __init__(self, app, environ):
         """ Initialize the exchange. """
         self.app = app
         self.environ = environ
         self.timer = None
+        self.timing = Timing() if app.timing else NULL_TIMING
+        self.route = None # The matched Route, if any
 
         self.response = Response(self) # We always have a response object
         self.request = None # Not created until the exchange is started
@@ -290,3 +653,52 @@ class Exchange:
         """ Finalize the exchange. """
         # self.session.finalize(self.response)
 
+        etag = self.app.etag
+        if self.route is not None:
+            etag = self.route.options.get("etag", etag)
+
+        if etag:
+            self._auto_etag(etag == "weak")
+
+    def not_modified(self, etag, weak=False):
+        """ Set the response ETag and test it against If-None-Match.
+            The etag is the opaque value without quotes.  If the client's
+            copy is still fresh, the response is set to 304 and True is
+            returned so the handler can skip building the content.
+        """
+        etag = '"{0}"'.format(etag)
+        if weak:
+            etag = "W/" + etag
+
+        self.response.headers["ETag"] = etag
+        return self._check_not_modified(etag)
+
+    def _auto_etag(self, weak):
+        """ Generate an ETag from bytes or str content. """
+        response = self.response
+        if response.status != 200 or "ETag" in response.headers or \
+                self.request.method not in ("GET", "HEAD"):
+            return
+
+        content = response.content
+        if isinstance(content, str):
+            content = response.content = content.encode("utf-8")
+        elif not isinstance(content, bytes):
+            return
+
+        etag = '"{0}"'.format(hashlib.blake2b(content, digest_size=16).hexdigest())
+        if weak:
+            etag = "W/" + etag
+
+        response.headers["ETag"] = etag
+        self._check_not_modified(etag)
+
+    def _check_not_modified(self, etag):
+        """ Change the response to 304 if If-None-Match matches etag. """
+        if etag_matches(self.environ.get("HTTP_IF_NONE_MATCH"), etag):
+            self.response.status = 304
+            self.response.content = b""
+            return True
+
+        return False
+
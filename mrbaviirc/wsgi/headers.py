@@ -0,0 +1,248 @@
+""" HTTP header helpers. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = [
+    "Headers", "EnvironHeaders", "parse_accept", "http_date",
+    "parse_http_date", "etag_matches"
+]
+
+
+from collections.abc import Mapping
+from email.utils import formatdate, parsedate_to_datetime
+
+
+class Headers:
+    """ Response headers, which may repeat such as Set-Cookie.
+        The headers are kept as the list of (name, value) pairs passed to
+        start_response, so they are sent without being rebuilt.  Names are
+        case-insensitive.  Setting a header replaces all of its values, add
+        appends another value.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, headers=None):
+        """ Initialize from a mapping or (name, value) pairs. """
+        self._items = []
+        if headers is not None:
+            self.update(headers)
+
+    def __repr__(self):
+        return "Headers({0!r})".format(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return (name for (name, _) in self._items)
+
+    def __contains__(self, name):
+        name = name.lower()
+        for (key, _) in self._items:
+            if key.lower() == name:
+                return True
+        return False
+
+    def __getitem__(self, name):
+        """ Return the first value of a header. """
+        lname = name.lower()
+        for (key, value) in self._items:
+            if key.lower() == lname:
+                return value
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        """ Set a header, replacing any existing values in place. """
+        lname = name.lower()
+        items = self._items
+        for (index, (key, _)) in enumerate(items):
+            if key.lower() == lname:
+                items[index] = (name, value)
+                items[index + 1:] = [
+                    item for item in items[index + 1:] if item[0].lower() != lname
+                ]
+                return
+
+        items.append((name, value))
+
+    def __delitem__(self, name):
+        """ Remove all values of a header. """
+        lname = name.lower()
+        count = len(self._items)
+        self._items[:] = [item for item in self._items if item[0].lower() != lname]
+        if len(self._items) == count:
+            raise KeyError(name)
+
+    def get(self, name, default=None):
+        """ Return the first value of a header or default. """
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def get_all(self, name):
+        """ Return a list of all values of a header. """
+        name = name.lower()
+        return [value for (key, value) in self._items if key.lower() == name]
+
+    def add(self, name, value):
+        """ Add a value without replacing existing ones. """
+        self._items.append((name, value))
+
+    def setdefault(self, name, value):
+        """ Set a header if it isn't set.  Return its first value. """
+        try:
+            return self[name]
+        except KeyError:
+            self._items.append((name, value))
+            return value
+
+    def update(self, headers):
+        """ Set headers from a mapping or (name, value) pairs. """
+        if hasattr(headers, "keys"):
+            headers = [(name, headers[name]) for name in headers.keys()]
+
+        for (name, value) in headers:
+            self[name] = value
+
+    def extend(self, headers):
+        """ Add (name, value) pairs without replacing existing ones. """
+        self._items.extend(headers)
+
+    def clear(self):
+        """ Remove all headers. """
+        self._items.clear()
+
+    def keys(self):
+        """ Return the header names, repeated names included. """
+        return [name for (name, _) in self._items]
+
+    def values(self):
+        """ Return the header values. """
+        return [value for (_, value) in self._items]
+
+    def items(self):
+        """ Return the list of (name, value) pairs.
+            This is the list itself and not a copy.
+        """
+        return self._items
+
+
+class EnvironHeaders(Mapping):
+    """ A read-only, case-insensitive view of the request headers.
+        Nothing is copied, each lookup goes to the HTTP_* keys, and
+        CONTENT_TYPE and CONTENT_LENGTH, of the WSGI environ.
+    """
+
+    __slots__ = ("_environ",)
+
+    def __init__(self, environ):
+        """ Initialize the view. """
+        self._environ = environ
+
+    @staticmethod
+    def _key(name):
+        """ Convert a header name to its environ key. """
+        key = name.upper().replace("-", "_")
+        if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            return key
+        return "HTTP_" + key
+
+    def __getitem__(self, name):
+        try:
+            return self._environ[self._key(name)]
+        except KeyError:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and self._key(name) in self._environ
+
+    def get(self, name, default=None):
+        return self._environ.get(self._key(name), default)
+
+    def __iter__(self):
+        """ Yield the header names, such as User-Agent. """
+        for key in self._environ:
+            if key.startswith("HTTP_"):
+                key = key[5:]
+            elif key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                continue
+            yield key.replace("_", "-").title()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "EnvironHeaders({0!r})".format(dict(self.items()))
+
+
+def parse_accept(value):
+    """ Parse an Accept style header into a dict of lower case value: q. """
+    result = {}
+    if not value:
+        return result
+
+    for item in value.split(","):
+        (name, _, params) = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+
+        quality = 1.0
+        for param in params.split(";"):
+            (key, _, param_value) = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(param_value.strip())
+                except ValueError:
+                    quality = 0.0
+
+        result[name] = quality
+
+    return result
+
+
+def http_date(timestamp):
+    """ Format a timestamp as an HTTP date. """
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    """ Parse an HTTP date into a timestamp, or None if it isn't valid. """
+    if not value:
+        return None
+
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def etag_matches(header, etag):
+    """ Test if an If-None-Match style header matches an ETag.
+        The weak comparison is used, so W/"x" and "x" match.
+    """
+    if not header or not etag:
+        return False
+
+    header = header.strip()
+    if header == "*":
+        return True
+
+    if etag.startswith("W/"):
+        etag = etag[2:]
+
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+
+    return False
@@ -0,0 +1,243 @@
+""" Background log writing with duplicate suppression. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["LogQueue", "DuplicateFilter"]
+
+
+from collections import OrderedDict
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+from . import _fork
+
+
+class DuplicateFilter(logging.Filter):
+    """ Rate limit records with the same traceback.
+        The first record with a traceback passes, then records with the
+        same exception type and frames are counted but suppressed for
+        interval seconds.  After that a summary of how many were suppressed
+        is passed to emit, when the next record is filtered or sweep is
+        called.  Records without a traceback always pass.  At most keys
+        tracebacks are tracked.
+    """
+
+    def __init__(self, emit, interval=60.0, keys=1024):
+        """ Initialize the filter. """
+        logging.Filter.__init__(self)
+        self.emit = emit
+        self.interval = interval
+        self.keys = keys
+
+        self._seen = OrderedDict() # key: [start, suppressed, name, level, label]
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def filter(self, record):
+        exc_info = record.exc_info
+        if not exc_info or exc_info[0] is None:
+            return True
+
+        # Only the frame positions are used, nothing is formatted
+        frames = []
+        tb = exc_info[2]
+        while tb is not None:
+            frames.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno))
+            tb = tb.tb_next
+        key = (exc_info[0], tuple(frames))
+
+        now = time.monotonic()
+        with self._lock:
+            summaries = self._sweep(now) if now >= self._next_sweep else []
+
+            entry = self._seen.get(key)
+            if entry is not None:
+                entry[1] += 1
+                passed = False
+            else:
+                where = "{0}:{1}".format(*frames[-1]) if frames else "?"
+                self._seen[key] = [
+                    now, 0, record.name, record.levelno,
+                    "{0} at {1}".format(exc_info[0].__name__, where)
+                ]
+                while len(self._seen) > self.keys:
+                    summaries.append(self._seen.popitem(last=False)[1])
+                passed = True
+
+        self._summarize(summaries, now)
+        return passed
+
+    def _sweep(self, now):
+        """ Remove entries whose interval is over and return them. """
+        self._next_sweep = now + min(1.0, self.interval)
+
+        expired = []
+        for (key, entry) in self._seen.items():
+            if now - entry[0] >= self.interval:
+                expired.append(key)
+        return [self._seen.pop(key) for key in expired]
+
+    def _summarize(self, entries, now):
+        for (start, count, name, level, label) in entries:
+            if count:
+                self.emit(logging.LogRecord(
+                    name, level, "", 0,
+                    "%d more occurrences of %s in the last %.0f seconds",
+                    (count, label, now - start), None
+                ))
+
+    def sweep(self):
+        """ Emit the summaries of records whose interval is over. """
+        now = time.monotonic()
+        with self._lock:
+            summaries = self._sweep(now)
+
+        self._summarize(summaries, now)
+
+    def flush(self):
+        """ Emit the summaries of all suppressed records. """
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._seen.values())
+            self._seen.clear()
+
+        self._summarize(entries, now)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """ Pass records to the LogQueue without formatting them. """
+
+    def __init__(self, log):
+        logging.handlers.QueueHandler.__init__(self, None)
+        self.log = log
+
+    def prepare(self, record):
+        # The message and traceback are formatted by the writer thread
+        return record
+
+    def enqueue(self, record):
+        self.log.put(record)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """ A listener that can be stopped while the queue is full.
+        If given, sweep is called from the thread every interval seconds,
+        even while no records arrive.
+    """
+
+    def __init__(self, records, handlers, sweep=None, interval=1.0):
+        logging.handlers.QueueListener.__init__(
+            self, records, *handlers, respect_handler_level=True
+        )
+        self.sweep = sweep
+        self.interval = interval
+        self._next_sweep = time.monotonic() + interval
+
+    def dequeue(self, block):
+        if self.sweep is None or not block:
+            return self.queue.get(block)
+
+        while True:
+            now = time.monotonic()
+            if now >= self._next_sweep:
+                self.sweep()
+                self._next_sweep = now + self.interval
+
+            try:
+                return self.queue.get(True, self._next_sweep - now)
+            except queue.Empty:
+                pass
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LogQueue:
+    """ Write log records from a background thread.
+        Records logged through handler are put in a queue of at most size
+        records, and a thread passes them to handlers.  Messages and
+        tracebacks are formatted by that thread, so logging an exception
+        costs the request little.  Records are dropped and counted if the
+        queue is full.  With an interval, repeated tracebacks are limited
+        by a DuplicateFilter, whose summaries the thread writes once the
+        interval is over.  Before start and after stop records are
+        written directly.  A started queue restarts its thread in a forked
+        child and drops the records the parent had queued.
+    """
+
+    def __init__(self, handlers, size=10000, interval=60.0):
+        """ Initialize the log queue. """
+        self.handlers = list(handlers)
+        self.size = size
+        self.dropped = 0
+
+        self.handler = _QueueHandler(self)
+        self.filter = None
+        if interval:
+            self.filter = DuplicateFilter(self.put, interval)
+            self.handler.addFilter(self.filter)
+
+        self._queue = None
+        self._listener = None
+
+    def start(self):
+        """ Start the writer thread. """
+        if self._listener is not None:
+            return
+
+        self._queue = queue.Queue(self.size)
+        if self.filter is not None:
+            self._listener = _QueueListener(
+                self._queue, self.handlers, self.filter.sweep, min(1.0, self.filter.interval)
+            )
+        else:
+            self._listener = _QueueListener(self._queue, self.handlers)
+        self._listener.start()
+        _fork.started(self)
+
+    def stop(self):
+        """ Write the remaining records and stop the writer thread. """
+        if self._listener is None:
+            return
+
+        _fork.stopped(self)
+        if self.filter is not None:
+            self.filter.flush()
+
+        self._listener.stop()
+        self._listener = None
+        self._queue = None
+
+        for handler in self.handlers:
+            handler.flush()
+
+    def put(self, record):
+        """ Queue a record without blocking. """
+        records = self._queue
+        if records is None:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+
+        try:
+            records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _after_fork(self):
+        self._listener = None
+        if self.filter is not None:
+            self.filter._after_fork() # pylint: disable=protected-access
+        self.start()
@@ -0,0 +1,220 @@
+""" Per route request metrics. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["Metrics"]
+
+
+from bisect import bisect_left
+import threading
+import time
+import weakref
+
+
+UNMATCHED = "<unmatched>" # The route label of requests without a route
+
+
+class _RouteStats:
+    """ The counters of one route in one shard. """
+
+    __slots__ = ("count", "total", "in_flight", "statuses", "buckets")
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.total = 0.0 # Sum of the durations
+        self.in_flight = 0
+        self.statuses = [0] * 6 # Index is the status class, 1xx to 5xx
+        self.buckets = [0] * (buckets + 1) # The last one is +Inf
+
+    def merge(self, other):
+        """ Add the counters of another shard. """
+        self.count += other.count
+        self.total += other.total
+        self.in_flight += other.in_flight
+        self.statuses = [a + b for (a, b) in zip(self.statuses, other.statuses)]
+        self.buckets = [a + b for (a, b) in zip(self.buckets, other.buckets)]
+
+
+class _ShardOwner:
+    """ Kept by a thread so its shard can be retired when it exits. """
+
+    __slots__ = ("__weakref__",)
+
+
+class Metrics:
+    """ Count requests and their latency per route.
+        Routes are keyed by method and registered path pattern.  Each
+        thread records into its own shard, so recording takes no locks and
+        the shards are only added up when the metrics are collected.  When
+        a thread exits its shard is added to the retired totals.
+    """
+
+    DEFAULT_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+
+    def __init__(self, buckets=None):
+        """ Initialize the metrics with the histogram bucket bounds. """
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+
+        self.collectors = [] # Callables returning more Prometheus text
+
+        self._local = threading.local()
+        self._shards = {} # id: shard of live threads
+        self._retired = {} # Totals of the shards of exited threads
+        self._lock = threading.Lock() # Only for adding and retiring shards
+
+    def _shard(self):
+        """ Return the shard of the current thread. """
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            owner = self._local.owner = _ShardOwner()
+            weakref.finalize(owner, self._retire, shard)
+            with self._lock:
+                self._shards[id(shard)] = shard
+            return shard
+
+    def _retire(self, shard):
+        """ Move the counters of an exited thread to the retired totals. """
+        with self._lock:
+            del self._shards[id(shard)]
+            _merge(self._retired, shard)
+
+    def _stats(self, key):
+        shard = self._shard()
+        stats = shard.get(key)
+        if stats is None:
+            stats = shard[key] = _RouteStats(len(self.buckets))
+        return stats
+
+    def begin(self, route):
+        """ Count a request to a route as in flight. """
+        self._stats((route.method, route.path)).in_flight += 1
+
+    def record(self, exchange):
+        """ Record a finished exchange.
+            The in flight count is ended if the exchange has a route.
+        """
+        route = exchange.route
+        if route is not None:
+            stats = self._stats((route.method, route.path))
+            stats.in_flight -= 1
+        else:
+            stats = self._stats((exchange.environ.get("REQUEST_METHOD", ""), UNMATCHED))
+
+        duration = 0.0
+        if exchange.timer is not None:
+            duration = time.monotonic() - exchange.timer
+
+        stats.count += 1
+        stats.total += duration
+        stats.statuses[min(exchange.response.status // 100, 5)] += 1
+        stats.buckets[bisect_left(self.buckets, duration)] += 1
+
+    def collect(self):
+        """ Return a dict of (method, path) to the totals of all shards.
+            Each total is a dict with count, sum, in_flight, statuses (a
+            dict of "2xx" style class to count), and buckets (a list of
+            (bound, cumulative count) with a last bound of +Inf).
+        """
+        totals = {}
+        with self._lock:
+            shards = list(self._shards.values())
+            _merge(totals, self._retired)
+
+        for shard in shards:
+            _merge(totals, shard)
+
+        result = {}
+        for (key, total) in totals.items():
+            cumulative = 0
+            buckets = []
+            for (bound, count) in zip(self.buckets + (float("inf"),), total.buckets):
+                cumulative += count
+                buckets.append((bound, cumulative))
+
+            result[key] = {
+                "count": total.count,
+                "sum": total.total,
+                "in_flight": total.in_flight,
+                "statuses": {
+                    "{0}xx".format(index): count
+                    for (index, count) in enumerate(total.statuses)
+                    if count and index
+                },
+                "buckets": buckets
+            }
+
+        return result
+
+    def prometheus(self):
+        """ Return the metrics in the Prometheus text format. """
+        lines = [
+            "# HELP http_requests_total Requests by route and status class.",
+            "# TYPE http_requests_total counter"
+        ]
+        collected = sorted(self.collect().items())
+        for ((method, path), total) in collected:
+            labels = _labels(method, path)
+            for (status, count) in sorted(total["statuses"].items()):
+                lines.append('http_requests_total{{{0},status="{1}"}} {2}'.format(
+                    labels, status, count
+                ))
+
+        lines.append("# HELP http_requests_in_flight Requests being handled by route.")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        for ((method, path), total) in collected:
+            lines.append("http_requests_in_flight{{{0}}} {1}".format(
+                _labels(method, path), total["in_flight"]
+            ))
+
+        lines.append("# HELP http_request_duration_seconds Request latency by route.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for ((method, path), total) in collected:
+            labels = _labels(method, path)
+            for (bound, count) in total["buckets"]:
+                bound = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('http_request_duration_seconds_bucket{{{0},le="{1}"}} {2}'.format(
+                    labels, bound, count
+                ))
+            lines.append("http_request_duration_seconds_sum{{{0}}} {1!r}".format(
+                labels, total["sum"]
+            ))
+            lines.append("http_request_duration_seconds_count{{{0}}} {1}".format(
+                labels, total["count"]
+            ))
+
+        text = "\n".join(lines) + "\n"
+        for collector in self.collectors:
+            text += collector()
+
+        return text
+
+    def handle(self, exchange):
+        """ A route handler serving the Prometheus text format. """
+        response = exchange.response
+        response.status = 200
+        response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+        response.content = self.prometheus()
+
+
+def _merge(totals, shard):
+    """ Add the counters of a shard to a dict of totals. """
+    for (key, stats) in list(shard.items()):
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = _RouteStats(len(stats.buckets) - 1)
+        total.merge(stats)
+
+
+def _labels(method, path):
+    """ Format the method and route labels. """
+    path = path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return 'method="{0}",route="{1}"'.format(method, path)
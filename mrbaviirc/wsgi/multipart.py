@@ -0,0 +1,270 @@
+""" Streaming multipart/form-data parser. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["MultipartParser", "MultipartPart", "parse_header"]
+
+
+import codecs
+import re
+
+from .error import RequestError, RequestTooLargeError
+
+
+_PARAM_RE = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+def parse_header(value):
+    """ Parse a header such as 'form-data; name="value"'.
+        Return value is a tuple of the lower case main value and a dict of
+        the parameters with lower case names.
+    """
+    (main, _, rest) = value.partition(";")
+    params = {}
+
+    for matched in _PARAM_RE.finditer(";" + rest):
+        param = matched.group(2).strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = param[1:-1].replace("\\\\", "\\").replace('\\"', '"')
+        params[matched.group(1).lower()] = param
+
+    return (main.strip().lower(), params)
+
+
+class MultipartPart:
+    """ A single part of a multipart body.
+        The data can only be read once and must be read before the next part
+        is requested from the parser.  Any unread data is skipped.
+    """
+
+    def __init__(self, headers, chunks):
+        """ Initialize the part from its headers and data chunk iterator. """
+        self.headers = headers # lower case name: value
+
+        (_, disposition) = parse_header(headers.get("content-disposition", ""))
+        self.name = disposition.get("name")
+        self.filename = disposition.get("filename")
+
+        (self.content_type, params) = parse_header(
+            headers.get("content-type", "text/plain")
+        )
+        self.charset = params.get("charset", "utf-8")
+        try:
+            codecs.lookup(self.charset)
+        except LookupError:
+            self.charset = "utf-8"
+
+        self._chunks = chunks
+
+    def __iter__(self):
+        """ Iterate the data as chunks of bytes. """
+        return self._chunks
+
+    def read(self, limit=0):
+        """ Read all the remaining data.
+            If limit is set, RequestTooLargeError is raised as soon as more
+            than limit bytes are read.
+        """
+        if not limit:
+            return b"".join(self._chunks)
+
+        chunks = []
+        size = 0
+        for chunk in self._chunks:
+            size += len(chunk)
+            if size > limit:
+                raise RequestTooLargeError("Multipart field too large")
+            chunks.append(chunk)
+
+        return b"".join(chunks)
+
+    def save(self, file):
+        """ Write all the remaining data to a file object.
+            Return the number of bytes written.
+        """
+        size = 0
+        for chunk in self._chunks:
+            file.write(chunk)
+            size += len(chunk)
+
+        return size
+
+
+class MultipartParser:
+    """ Parse a multipart/form-data body incrementally.
+        The input is read in chunks of at most chunk_size bytes and no more
+        than content_length bytes are ever read, or until the input ends if
+        it is None.  If limits are given, they are checked as the data is
+        read and RequestTooLargeError is raised as soon as one is exceeded.
+    """
+
+    MAX_HEADER_SIZE = 16384
+
+    def __init__(self, stream, boundary, content_length, chunk_size=65536, limits=None):
+        """ Initialize the parser. """
+        if not boundary:
+            raise RequestError("Missing multipart boundary")
+
+        self._limits = limits
+
+        self._stream = stream
+        self._remaining = content_length
+        self._read = 0
+        self._chunk_size = chunk_size
+
+        self._boundary = b"--" + boundary.encode("latin-1")
+        self._delimiter = b"\r\n" + self._boundary
+        self._buffer = bytearray()
+        self._done = False
+
+    def _fill(self):
+        """ Read the next chunk into the buffer.  Return False at the end. """
+        remaining = self._remaining
+        if remaining is not None and remaining <= 0:
+            return False
+
+        size = self._chunk_size if remaining is None else min(self._chunk_size, remaining)
+        data = self._stream.read(size)
+        if not data:
+            self._remaining = 0
+            return False
+
+        if remaining is None:
+            # Without a length the body size is checked as it is read
+            self._read += len(data)
+            limits = self._limits
+            if limits is not None and limits.max_body and self._read > limits.max_body:
+                raise RequestTooLargeError("Request body too large")
+        else:
+            self._remaining -= len(data)
+
+        self._buffer.extend(data)
+        return True
+
+    def _need(self, size):
+        """ Make sure the buffer has at least size bytes. """
+        while len(self._buffer) < size:
+            if not self._fill():
+                raise RequestError("Unexpected end of multipart data")
+
+    def _find(self, value, limit=None):
+        """ Find a value in the buffer, reading more as needed. """
+        start = 0
+        while True:
+            offset = self._buffer.find(value, start)
+            if offset >= 0:
+                return offset
+
+            if limit is not None and len(self._buffer) > limit:
+                raise RequestError("Multipart headers too large")
+
+            start = max(0, len(self._buffer) - len(value) + 1)
+            if not self._fill():
+                raise RequestError("Unexpected end of multipart data")
+
+    def _after_boundary(self):
+        """ Handle what follows a boundary.  Return False at the end. """
+        self._need(2)
+        ending = bytes(self._buffer[:2])
+        del self._buffer[:2]
+
+        if ending == b"--":
+            # Skip any epilogue without keeping it
+            self._buffer.clear()
+            while self._fill():
+                self._buffer.clear()
+            return False
+
+        if ending != b"\r\n":
+            raise RequestError("Invalid multipart boundary")
+
+        return True
+
+    def _read_headers(self):
+        """ Read the headers of a part. """
+        self._need(2)
+        if self._buffer[:2] == b"\r\n":
+            # No headers at all
+            del self._buffer[:2]
+            return {}
+
+        offset = self._find(b"\r\n\r\n", self.MAX_HEADER_SIZE)
+        lines = bytes(self._buffer[:offset]).decode("utf-8", "replace").split("\r\n")
+        del self._buffer[:offset + 4]
+
+        headers = {}
+        for line in lines:
+            (name, sep, value) = line.partition(":")
+            if not sep:
+                raise RequestError("Invalid multipart header")
+            headers[name.strip().lower()] = value.strip()
+
+        return headers
+
+    def _iter_data(self, limit=0):
+        """ Yield the data of the current part until the next delimiter.
+            If limit is set, the part may not have more than limit bytes.
+        """
+        delimiter = self._delimiter
+        keep = len(delimiter) - 1
+        buffer = self._buffer
+        size = 0
+
+        while True:
+            offset = buffer.find(delimiter)
+            if offset >= 0:
+                if limit and size + offset > limit:
+                    raise RequestTooLargeError("Multipart field too large")
+                if offset:
+                    yield bytes(buffer[:offset])
+                del buffer[:offset + len(delimiter)]
+                return
+
+            # Hold back anything that might be the start of a delimiter
+            if len(buffer) > keep:
+                size += len(buffer) - keep
+                if limit and size > limit:
+                    raise RequestTooLargeError("Multipart field too large")
+
+                chunk = bytes(buffer[:-keep])
+                del buffer[:-keep]
+                yield chunk
+
+            if not self._fill():
+                raise RequestError("Unexpected end of multipart data")
+
+    def __iter__(self):
+        """ Yield each MultipartPart in turn. """
+        if self._done:
+            return
+
+        # Skip the preamble
+        offset = self._find(self._boundary)
+        del self._buffer[:offset + len(self._boundary)]
+
+        limits = self._limits
+        count = 0
+
+        while self._after_boundary():
+            count += 1
+            if limits is not None and limits.max_fields and count > limits.max_fields:
+                raise RequestTooLargeError("Too many multipart fields")
+
+            part = MultipartPart(self._read_headers(), None)
+            limit = 0
+            if limits is not None:
+                limit = limits.max_file_size if part.filename else limits.max_field_size
+
+            data = part._chunks = self._iter_data(limit) # pylint: disable=protected-access
+            yield part
+
+            # Skip anything the caller didn't read
+            for _ in data:
+                pass
+
+        self._done = True
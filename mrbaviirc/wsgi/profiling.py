@@ -0,0 +1,135 @@
+""" On demand profiling of requests. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["Profiler"]
+
+
+import cProfile
+import hmac
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class Profiler:
+    """ Profile selected requests with cProfile.
+        The app runs the handler of a matched route through the profiler.
+        It is profiled if it is picked by the sample rate, if the route's
+        path pattern or name is in routes, or if the request has the header
+        set to the secret.  The stats are written as .pstats files to the
+        directory, with the top allocations in a .malloc.txt file when
+        tracemalloc is set.  Only the newest keep requests are kept, and
+        only one request is profiled at a time.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, routes=(), header="X-Profile",
+                 secret=None, tracemalloc=False, keep=20): # pylint: disable=redefined-outer-name
+        """ Initialize the profiler. """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.routes = frozenset(routes)
+        self.header = "HTTP_" + header.upper().replace("-", "_") if header else None
+        self.secret = secret.encode("utf-8") if secret else None
+        self.tracemalloc = tracemalloc
+        self.keep = keep
+
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def triggered(self, exchange):
+        """ Test if the request of an exchange should be profiled. """
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+
+        if self.secret is not None and self.header is not None:
+            # Header values are latin-1 decoded, compare the raw bytes
+            value = exchange.environ.get(self.header)
+            if value is not None and hmac.compare_digest(value.encode("latin-1"), self.secret):
+                return True
+
+        if self.routes:
+            route = exchange.route
+            if route is not None and (route.path in self.routes or route.name in self.routes):
+                return True
+
+        return False
+
+    def run(self, exchange, handler):
+        """ Call handler(exchange), profiling it if triggered. """
+        if not self.triggered(exchange) or not self._lock.acquire(blocking=False):
+            handler(exchange)
+            return
+
+        try:
+            self._profile(exchange, handler)
+        finally:
+            self._lock.release()
+
+    def _profile(self, exchange, handler):
+        """ Call the handler under the profiler and save the results. """
+        started_tracemalloc = False
+        if self.tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            handler(exchange)
+        finally:
+            profile.disable()
+
+            snapshot = None
+            if self.tracemalloc and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+            self._save(exchange, profile, snapshot)
+
+    def _save(self, exchange, profile, snapshot):
+        """ Write the results and remove old ones. """
+        request = exchange.request
+        now = time.time()
+        name = "{0}-{1:03d}-{2}-{3}".format(
+            time.strftime("%Y%m%d-%H%M%S", time.localtime(now)),
+            int(now * 1000) % 1000,
+            request.method,
+            _UNSAFE_RE.sub("_", request.path_info.strip("/"))[:64] or "_"
+        )
+        base = os.path.join(self.directory, name)
+
+        profile.dump_stats(base + ".pstats")
+        if snapshot is not None:
+            with open(base + ".malloc.txt", "w") as handle:
+                for stat in snapshot.statistics("lineno")[:50]:
+                    handle.write(str(stat) + "\n")
+
+        self._prune()
+
+    def _prune(self):
+        """ Remove all but the newest keep results. """
+        results = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pstats"):
+                results.append((entry.stat().st_mtime, entry.name[:-7]))
+
+        results.sort(reverse=True)
+        for (_, name) in results[self.keep:]:
+            for suffix in (".pstats", ".malloc.txt"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except OSError:
+                    pass
@@ -6,61 +6,218 @@ __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
-__all__ = ["Router"]
+__all__ = ["Router", "Route"]
 
 
 from collections import OrderedDict
+import hashlib
+import importlib
+import inspect
+import json
+import os
 import re
+import sys
+from urllib.parse import quote as url_quote
+from urllib.parse import urlencode
 
+from .cache import LruCache
+from .converters import DEFAULT_CONVERTERS
 from .error import RouteError
 
 
+class _VarMatcher:
+    """ Match a whole path component natively with a converter. """
+
+    __slots__ = ("matchall", "name", "converter")
+
+    def __init__(self, name, converter):
+        self.matchall = converter.matchall
+        self.name = name
+        self.converter = converter
+
+    def match(self, value):
+        """ Return the converted parameters or None. """
+        try:
+            return {self.name: self.converter.to_python(value)}
+        except ValueError:
+            return None
+
+
+class _RegexMatcher:
+    """ Match a path component with a regex, converting any typed groups. """
+
+    __slots__ = ("matchall", "regex", "converters")
+
+    def __init__(self, matchall, regex, converters):
+        self.matchall = matchall
+        self.regex = regex
+        self.converters = converters # ((name, converter), ...)
+
+    def match(self, value):
+        """ Return the converted parameters or None. """
+        matched = self.regex.match(value)
+        if not matched:
+            return None
+
+        params = matched.groupdict()
+        try:
+            for (name, converter) in self.converters:
+                params[name] = converter.to_python(params[name])
+        except ValueError:
+            return None
+
+        return params
+
+
+_SNAPSHOT_VERSION = 1
+
+
+def _handler_ref(route):
+    """ Return the "module:qualname" import path of a route or None. """
+    if inspect.ismethod(route):
+        return None # Would resolve to the function, not the bound method
+
+    module = getattr(route, "__module__", None)
+    qualname = getattr(route, "__qualname__", None)
+    if not module or not qualname or "<" in qualname:
+        return None
+
+    return module + ":" + qualname
+
+
+def _snapshot_options(options):
+    """ Return options as they would be after a snapshot, or None. """
+    try:
+        return json.loads(json.dumps(options)) # Tuples become lists and so on
+    except (TypeError, ValueError):
+        return None
+
+
+def _resolve_handler(ref):
+    """ Import a route from its "module:qualname" import path. """
+    (module, _, qualname) = ref.partition(":")
+    target = importlib.import_module(module)
+    for attr in qualname.split("."):
+        target = getattr(target, attr)
+
+    return target
+
+
+class Route:
+    """ A registered route. """
+
+    __slots__ = ("handler", "method", "path", "name", "options", "is_async")
+
+    def __init__(self, handler, method, path, name, options):
+        self.handler = handler # Called with the exchange
+        self.method = method
+        self.path = path # The registered path pattern
+        self.name = name
+        self.options = options # Extra keyword arguments given to register
+
+        # An async def handler, or an object with an async __call__
+        self.is_async = inspect.iscoroutinefunction(handler) or \
+            inspect.iscoroutinefunction(getattr(handler, "__call__", None))
+
+    def __repr__(self):
+        return "<Route {0} {1}>".format(self.method, self.path)
+
+
+class _UrlBuilder:
+    """ Build a path from a named route's literal chunks and variable slots. """
+
+    __slots__ = ("prefix", "slots")
+
+    def __init__(self, prefix, slots):
+        self.prefix = prefix # Literal text before the first variable
+        self.slots = slots # ((name, to_url, safe, literal after), ...)
+
+    def build(self, params, quote=False):
+        """ Build the path from the params. """
+        result = [self.prefix]
+        for (name, to_url, safe, literal) in self.slots:
+            try:
+                value = to_url(params[name])
+            except KeyError:
+                raise RouteError("No parameter for named path: " + name)
+
+            if quote:
+                value = url_quote(value, safe=safe)
+
+            result.append(value)
+            result.append(literal)
+
+        return "".join(result)
+
+
+def _method_route(routes, method):
+    """ Return the route of a method, serving HEAD with GET if needed. """
+    route = routes.get(method)
+    if route is None and method == "HEAD":
+        route = routes.get("GET")
+    return route
+
+
+def _allowed(allowed):
+    """ Return the allowed methods, with HEAD wherever GET is. """
+    if "GET" in allowed:
+        allowed.add("HEAD")
+    return frozenset(allowed)
+
+
 class _PathSegment:
     """ An entry for a path segment. """
 
     def __init__(self):
-        """ Initialize our subpath segments and route for this segment. """
+        """ Initialize our subpath segments and routes for this segment. """
         self.static = OrderedDict() # Dict keys are path component
-        self.dynamic = OrderedDict() # Dict keys are (matchall, regex)
-        self.route = None
+        self.dynamic = OrderedDict() # Dict keys are matchers
+        self.routes = {} # method -> route
 
-    def find_match(self, parts, params):
-        """ Find a submatch of the given path. """
+    def find_match(self, parts, params, method, allowed):
+        """ Find a submatch of the given path.
+            The methods of any paths that match but don't have a route for
+            the method are added to allowed.
+        """
 
         # No more parts, we are the match
         if not parts:
-            if self.route is not None:
-                return (self.route, params)
+            route = _method_route(self.routes, method)
+            if route is not None:
+                return (route, params)
 
+            allowed.update(self.routes)
             return None
 
         part = parts[0]
 
         # Check the static first
         if part in self.static:
-            result = self.static[part].find_match(parts[1:], params)
+            result = self.static[part].find_match(parts[1:], params, method, allowed)
             if result is not None:
                 return result
 
         # Unable to find in static, we'll check dynamic next
-        for (matchall, regex) in self.dynamic:
-            if matchall:
+        for (matcher, subsegment) in self.dynamic.items():
+            if matcher.matchall:
                 matchpart = "/".join(parts)
             else:
                 matchpart = part
 
-            matched = regex.match(matchpart)
-            if matched:
+            matched = matcher.match(matchpart)
+            if matched is not None:
                 # clone so if subpath segments fail we don't mess up parent path parameters
                 matched_params = dict(params)
-                matched_params.update(matched.groupdict())
+                matched_params.update(matched)
 
-                if matchall:
+                if matcher.matchall:
                     subparts = []
                 else:
                     subparts = parts[1:]
 
-                result = self.dynamic[(matchall, regex)].find_match(subparts, matched_params)
+                result = subsegment.find_match(
+                    subparts, matched_params, method, allowed
+                )
                 if result is not None:
                     return result
 
@@ -68,53 +225,177 @@ class _PathSegment:
         return None
 
 
+class _CompiledSegment:
+    """ A frozen, index based copy of a _PathSegment.
+        Instead of slicing the parts and cloning the parameters at each level,
+        the parts are walked by index and matched parameters are kept on
+        a stack that is only turned into the parameters once a route is found.
+    """
+
+    __slots__ = ("static", "dynamic", "routes")
+
+    def __init__(self, segment):
+        """ Compile from a _PathSegment. """
+        self.static = {
+            part: _CompiledSegment(subsegment)
+            for (part, subsegment) in segment.static.items()
+        }
+        self.dynamic = tuple(
+            (matcher.matchall, matcher.match, _CompiledSegment(subsegment))
+            for (matcher, subsegment) in segment.dynamic.items()
+        )
+        self.routes = dict(segment.routes)
+
+    def find_match(self, parts, count, path, index, offset, method, captured, allowed):
+        """ Find a submatch starting at parts[index].
+            The offset is the position of parts[index] within path, which
+            lets match all entries match the remainder without a join.
+            Matched parameters are pushed onto captured as the tree is walked
+            and popped again when backtracking.
+        """
+
+        # No more parts, we are the match
+        if index == count:
+            route = _method_route(self.routes, method)
+            if route is None:
+                allowed.update(self.routes)
+            return route
+
+        part = parts[index]
+
+        # Check the static first
+        subsegment = self.static.get(part)
+        if subsegment is not None:
+            route = subsegment.find_match(
+                parts, count, path, index + 1, offset + len(part) + 1,
+                method, captured, allowed
+            )
+            if route is not None:
+                return route
+
+        # Then the dynamic ones in registration order
+        for (matchall, match, subsegment) in self.dynamic:
+            if matchall:
+                matched = match(path[offset:])
+                if matched is not None:
+                    route = _method_route(subsegment.routes, method)
+                    if route is not None:
+                        captured.append(matched)
+                        return route
+                    allowed.update(subsegment.routes)
+                continue
+
+            matched = match(part)
+            if matched is not None:
+                captured.append(matched)
+                route = subsegment.find_match(
+                    parts, count, path, index + 1, offset + len(part) + 1,
+                    method, captured, allowed
+                )
+                if route is not None:
+                    return route
+                captured.pop()
+
+        # Got here with no match
+        return None
+
+
 class Router:
     """ A path -> router router. """
 
     _VAR_SPLIT_RE = re.compile("(<.*?>)")
-    _NAMED_STRIP_RE = re.compile("<([a-zA-Z0-9_]+)(:[^>]+)?>")
-    _NAMED_REPLACE_RE = re.compile("<([a-zA-Z0-9_]+)>")
 
 
-    def __init__(self):
-        """ Initialize the method entry. """
+    def __init__(self, cache_size=0, negative_cache_size=0):
+        """ Initialize the method entry.
+            If cache_size is set, route results are kept in an LRU cache of
+            that size.  Lookups that find no route are kept in a separate
+            cache of negative_cache_size so misses never evict hits.
+        """
+
+        self._routes = _PathSegment() # path -> {method: route}
+        self._named = {} # name -> url builder for each method
+        self._compiled = None # (static routes, compiled segment)
+
+        self._cache = None
+        self._negative_cache = None
+        self.set_cache(cache_size, negative_cache_size)
+
+        # We keep our own matcher cache to ensure identical path components
+        # always use the same matcher object so they share a _PathSegment
+        self._matcher_cache = {}
+        self._converters = dict(DEFAULT_CONVERTERS)
 
-        self._routes = {} # path -> route for each method
-        self._named = {} # name -> path for each method
+        self._registered = OrderedDict() # (method, path, name) -> Route
+        self._loaded = {} # (method, path, name) -> (handler ref, options) from a snapshot
+        self._unregistered = set() # Loaded keys not registered again yet
+        self.changed = False # Registered since the last load or save
 
-        # We keep our own regex cache to ensure identical regular expressions
-        # always match the same regex compiled object even if the python
-        # internal cache is cleared
-        self._re_cache = {}
+    def add_converter(self, name, converter):
+        """ Register a converter for use as <var:name> by all routes. """
+        if not name or ":" in name or name in ("re", "re*"):
+            raise ValueError("Invalid converter name: " + name)
 
-    def register(self, path, route, name=None, method="GET"):
-        """ Register a path to a given route. """
+        self._converters[name] = converter
+
+    def register(self, path, route, name=None, method="GET", **options):
+        """ Register a path to a given route.
+            Any options are kept on the Route for use by the application.
+        """
 
         method = method.upper()
-        if method in self._routes:
-            target = self._routes[method]
-        else:
-            target = self._routes[method] = _PathSegment()
+        key = (method, path, name)
+        self._unregistered.discard(key)
+
+        # Routes already loaded from a snapshot don't need to be parsed again
+        ref = _handler_ref(route)
+        if key in self._loaded and self._loaded[key] == (ref, _snapshot_options(options)):
+            entry = self._registered.get(key)
+            if entry is not None:
+                entry.options = options # Keep the original types
+            return
+
+        self._compiled = None
+        self.clear_cache()
+        entry = self._registered[key] = Route(route, method, path, name, options)
+        if ref is not None or inspect.isfunction(route):
+            self.changed = True # Objects and bound methods aren't saved
+
+        target = self._routes
 
         # Register the path -> route
         segments = self._split_path(path)
         for part in segments:
-            if isinstance(part, tuple):
+            if not isinstance(part, str):
                 target = target.dynamic.setdefault(part, _PathSegment())
             else:
                 target = target.static.setdefault(part, _PathSegment())
 
-        target.route = route
+        target.routes[method] = entry
 
         # Register the name -> path
         if name is not None:
             if method not in self._named:
                 self._named[method] = {}
 
-            self._named[method][name] = self._NAMED_STRIP_RE.sub(
-                "<\\1>",
-                path
-            )
+            self._named[method][name] = self._make_builder(path)
+
+    def _make_builder(self, path):
+        """ Precompile a path into a url builder. """
+        chunks = self._VAR_SPLIT_RE.split(path)
+        slots = []
+
+        # Split always places the variables at the odd indexes
+        for offset in range(1, len(chunks), 2):
+            (name, converter, matchall, _) = self._parse_var(chunks[offset][1:-1])
+            slots.append((
+                name,
+                str if converter is None else converter.to_url,
+                "/" if matchall else "",
+                chunks[offset + 1]
+            ))
+
+        return _UrlBuilder(chunks[0], tuple(slots))
 
     def _split_path(self, path):
         """  split our path into individual components. """
@@ -130,13 +411,18 @@ class Router:
 
             re_found = False # Is this part static or regex
             matchall_found = False # Is this regex a match all regex
+            converters = [] # (name, converter) of typed variables
 
             matches = list(i for i in self._VAR_SPLIT_RE.split(part) if i) # strip blanks
             for moffset, match in enumerate(matches):
                 if match[0:1] == "<" and match[-1:] == ">":
                     re_found = True
 
-                    (matchall, matches[moffset]) = self._parse_var(match[1:-1])
+                    (name, converter, matchall, regex) = self._parse_var(match[1:-1])
+                    matches[moffset] = "(?P<{0}>{1})".format(name, regex)
+                    if converter is not None:
+                        converters.append((name, converter))
+
                     if matchall:
                         matchall_found = True
 
@@ -149,82 +435,450 @@ class Router:
                 else:
                     matches[moffset] = re.escape(match)
 
-            # If this was regex, then compile it, else no changes
+            # If this was a variable, then build the matcher, else no changes
             if re_found:
-                # Reuse the same regex from cache if already compiled to ensure
-                # matching regex adds under a given segmetn always go to the same
+                # Reuse the same matcher from cache if already created to ensure
+                # matching adds under a given segment always go to the same
                 # _PathSegment object
-                regex_str = "^" + "".join(matches) + "$"
-                regex = self._re_cache.get(regex_str, None)
-                if regex is None:
-                    regex = self._re_cache[regex_str] = re.compile(regex_str)
-
-                parts[poffset] = (matchall_found, regex)
+                if len(matches) == 1 and converters and converters[0][1].native:
+                    # The whole component is one variable, skip the regex
+                    key = converters[0]
+                    matcher = self._matcher_cache.get(key, None)
+                    if matcher is None:
+                        matcher = self._matcher_cache[key] = _VarMatcher(*key)
+                else:
+                    regex_str = "^" + "".join(matches) + "$"
+                    key = (regex_str, tuple(converters))
+                    matcher = self._matcher_cache.get(key, None)
+                    if matcher is None:
+                        matcher = self._matcher_cache[key] = _RegexMatcher(
+                            matchall_found,
+                            re.compile(regex_str),
+                            tuple(converters)
+                        )
+
+                parts[poffset] = matcher
 
         return parts
 
-    @staticmethod
-    def _parse_var(part):
-        """ Parse the variable part for a regular expression.
-            Return value is a  tuple (matchall, regex).
+    def _parse_var(self, part):
+        """ Parse the variable part.
+            Return value is a tuple (name, converter, matchall, regex), where
+            converter is None for plain regular expression variables.
         """
         parts = part.split(":", 1)
         name = parts[0]
 
         if len(parts) == 1:
-            matchall = False
-            regex = "[^\\/]+"
+            vartype = "string"
         else:
             vartype = parts[1]
 
-            if vartype == "int":
-                matchall = False
-                regex = "-?\\d+"
-            elif vartype == "float":
-                matchall = False
-                regex = "-?[\\d.]+"
-            elif vartype == "path":
-                matchall = True
-                regex = ".*" # Note that path can match blank elements as well
-            elif vartype[0:3] == "re:":
-                matchall = False
-                regex = vartype[3:]
-            elif vartype[0:4] == "re*:":
-                matchall = True
-                regex = vartype[4:]
+        if vartype[0:3] == "re:":
+            return (name, None, False, vartype[3:])
+
+        if vartype[0:4] == "re*:":
+            return (name, None, True, vartype[4:])
+
+        converter = self._converters.get(vartype)
+        if converter is None:
+            raise ValueError("Unknown route filter: " + vartype)
+
+        return (name, converter, converter.matchall, converter.regex)
+
+    def freeze(self):
+        """ Compile the registered routes for faster lookups.
+            Paths without any variables are resolved with a single dict
+            lookup and the rest are matched by a compiled copy of the tree.
+            Registering another route discards the compiled copy, so freeze
+            should be called again once all routes are registered.
+        """
+        static = {}
+        self._collect_static(self._routes, [], static)
+        self._compiled = (static, _CompiledSegment(self._routes))
+
+    @property
+    def frozen(self):
+        """ Whether the routes are currently compiled. """
+        return self._compiled is not None
+
+    @classmethod
+    def _collect_static(cls, segment, parts, static):
+        """ Collect the routes of all paths made of only static parts.
+            The tree always checks static parts first, so a full static match
+            with a route for the method is always the same result a tree walk
+            would find.
+        """
+        for (part, subsegment) in segment.static.items():
+            subparts = parts + [part]
+            if subsegment.routes:
+                static["/".join(subparts)] = subsegment.routes
+            cls._collect_static(subsegment, subparts, static)
+
+    def save(self, filename, fingerprint=""):
+        """ Save the parsed routes to a snapshot file.
+            Routes are saved by import path, so functions must be module
+            level functions or class attributes.  Routes whose handler is an
+            object, such as StaticFiles, or a bound method are left out and
+            must be registered again after loading.  The fingerprint, along with the
+            modification times of the route modules, is used by load to
+            detect a stale snapshot.
+        """
+        names = {converter: name for (name, converter) in self._converters.items()}
+        saved = [
+            (entry, _handler_ref(entry.handler)) for entry in self._registered.values()
+        ]
+        for (entry, ref) in saved:
+            if ref is None and inspect.isfunction(entry.handler):
+                raise RouteError("Route can not be saved: " + repr(entry.handler))
+        saved = [(entry, ref) for (entry, ref) in saved if ref is not None]
+        indexes = {id(entry): index for (index, (entry, _)) in enumerate(saved)}
+        skipped = set(
+            (entry.method, entry.name) for entry in self._registered.values()
+            if entry.name is not None and id(entry) not in indexes
+        )
+        refs = set(ref for (_, ref) in saved)
+
+        def converter_name(converter):
+            try:
+                return names[converter]
+            except KeyError:
+                raise RouteError("Converter is not registered: " + repr(converter))
+
+        def dump_matcher(matcher):
+            if isinstance(matcher, _VarMatcher):
+                return ["var", matcher.name, converter_name(matcher.converter)]
+
+            return [
+                "re",
+                matcher.matchall,
+                matcher.regex.pattern,
+                [[name, converter_name(conv)] for (name, conv) in matcher.converters]
+            ]
+
+        def dump_segment(segment):
+            return [
+                {part: dump_segment(sub) for (part, sub) in segment.static.items()},
+                [[dump_matcher(m), dump_segment(sub)] for (m, sub) in segment.dynamic.items()],
+                {
+                    method: indexes[id(entry)]
+                    for (method, entry) in segment.routes.items()
+                    if id(entry) in indexes
+                }
+            ]
+
+        def dump_builder(builder):
+            return [
+                builder.prefix,
+                [
+                    [name, None if to_url is str else converter_name(to_url.__self__), safe, literal]
+                    for (name, to_url, safe, literal) in builder.slots
+                ]
+            ]
+
+        data = {
+            "version": _SNAPSHOT_VERSION,
+            "converters": sorted(names.values()),
+            "routes": dump_segment(self._routes),
+            "named": {
+                method: {
+                    name: dump_builder(builder) for (name, builder) in named.items()
+                    if (method, name) not in skipped
+                }
+                for (method, named) in self._named.items()
+            },
+            "registered": [
+                [entry.method, entry.path, entry.name, ref, entry.options]
+                for (entry, ref) in saved
+            ]
+        }
+
+        modules = set(ref.partition(":")[0] for ref in refs)
+        data["sources"] = sorted(
+            sys.modules[module].__file__ for module in modules
+            if getattr(sys.modules.get(module), "__file__", None)
+        )
+        data["fingerprint"] = self._fingerprint(
+            fingerprint, data["sources"], data["converters"]
+        )
+
+        try:
+            data = json.dumps(data, separators=(",", ":"))
+        except (TypeError, ValueError) as ex:
+            raise RouteError("Route options can not be saved: " + str(ex))
+
+        tmpname = filename + ".tmp"
+        with open(tmpname, "w", encoding="utf-8") as handle:
+            handle.write(data)
+        os.replace(tmpname, filename)
+
+        self.changed = False
+
+    def load(self, filename, fingerprint=""):
+        """ Load routes from a snapshot file, replacing any existing routes.
+            Return False without loading if the snapshot is missing, stale,
+            or refers to routes or converters that no longer exist.
+            Registering a route already in the snapshot is then a no-op,
+            and prune removes the ones that were not registered again.
+        """
+        try:
+            with open(filename, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("version") != _SNAPSHOT_VERSION:
+            return False
+
+        if any(name not in self._converters for name in data["converters"]):
+            return False
+
+        if data["fingerprint"] != self._fingerprint(
+                fingerprint, data["sources"], data["converters"]):
+            return False
+
+        # Set before importing the routes since that may register them again
+        self._loaded = {
+            (method, path, name): (ref, options)
+            for (method, path, name, ref, options) in data["registered"]
+        }
+        self._unregistered = set(self._loaded)
+
+        handlers = {}
+        try:
+            for (_, _, _, ref, _) in data["registered"]:
+                if ref not in handlers:
+                    handlers[ref] = _resolve_handler(ref)
+        except (ImportError, AttributeError):
+            self._loaded = {}
+            self._unregistered = set()
+            return False
+
+        entries = [
+            Route(handlers[ref], method, path, name, options)
+            for (method, path, name, ref, options) in data["registered"]
+        ]
+
+        converters = self._converters
+        matchers = {}
+
+        def load_matcher(desc):
+            if desc[0] == "var":
+                key = (desc[1], converters[desc[2]])
+                if key not in matchers:
+                    matchers[key] = _VarMatcher(*key)
             else:
-                raise ValueError("Unknown route filter: " + vartype)
+                typed = tuple((name, converters[conv]) for (name, conv) in desc[3])
+                key = (desc[2], typed)
+                if key not in matchers:
+                    matchers[key] = _RegexMatcher(desc[1], re.compile(desc[2]), typed)
+
+            return matchers[key]
+
+        def load_segment(desc):
+            segment = _PathSegment()
+            for (part, sub) in desc[0].items():
+                segment.static[part] = load_segment(sub)
+            for (matcher, sub) in desc[1]:
+                segment.dynamic[load_matcher(matcher)] = load_segment(sub)
+            segment.routes = {method: entries[index] for (method, index) in desc[2].items()}
+            return segment
+
+        def load_builder(desc):
+            return _UrlBuilder(desc[0], tuple(
+                (name, str if conv is None else converters[conv].to_url, safe, literal)
+                for (name, conv, safe, literal) in desc[1]
+            ))
+
+        self._routes = load_segment(data["routes"])
+        self._named = {
+            method: {name: load_builder(builder) for (name, builder) in named.items()}
+            for (method, named) in data["named"].items()
+        }
+        self._registered = OrderedDict(
+            ((entry.method, entry.path, entry.name), entry) for entry in entries
+        )
+        self._matcher_cache = matchers
+        self._compiled = None
+        self.clear_cache()
+        self.changed = False
+
+        return True
+
+    def prune(self):
+        """ Remove the routes loaded from a snapshot that were not
+            registered again, such as a route whose path changed.  This
+            should be called once all routes are registered and before
+            saving.  Return whether any routes were removed.
+        """
+        stale = self._unregistered
+        self._unregistered = set()
+        if not stale:
+            return False
+
+        # Rare enough that parsing the remaining routes again is fine
+        entries = [entry for (key, entry) in self._registered.items() if key not in stale]
+        self._routes = _PathSegment()
+        self._named = {}
+        self._registered = OrderedDict()
+        self._matcher_cache = {}
+        self._loaded = {}
+        self._compiled = None
+        self.clear_cache()
+
+        for entry in entries:
+            self.register(entry.path, entry.handler, entry.name, entry.method, **entry.options)
+
+        self.changed = True
+        return True
 
-        return (matchall, "(?P<{0}>{1})".format(name, regex))
+    @staticmethod
+    def _fingerprint(fingerprint, sources, converters):
+        """ Fingerprint a snapshot from the state of its route modules. """
+        digest = hashlib.sha1()
+        digest.update(repr((_SNAPSHOT_VERSION, fingerprint, converters)).encode("utf-8"))
+        for source in sources:
+            try:
+                stat = os.stat(source)
+            except OSError:
+                return None
+
+            digest.update(repr((source, stat.st_mtime_ns, stat.st_size)).encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def set_cache(self, cache_size, negative_cache_size=0):
+        """ Set the size of the route result caches.  A size of 0 disables
+            the cache.
+        """
+        self._cache = LruCache(cache_size) if cache_size > 0 else None
+        self._negative_cache = (
+            LruCache(negative_cache_size) if negative_cache_size > 0 else None
+        )
+
+    def clear_cache(self):
+        """ Clear any cached route results. """
+        if self._cache is not None:
+            self._cache.clear()
+
+        if self._negative_cache is not None:
+            self._negative_cache.clear()
+
+    def cache_stats(self):
+        """ Return the counters of the route caches. """
+        return {
+            "cache": self._cache.stats() if self._cache is not None else None,
+            "negative": (
+                self._negative_cache.stats()
+                if self._negative_cache is not None else None
+            )
+        }
 
     def route(self, path, method="GET"):
-        """ For a given path return the route or None. """
+        """ For a given path return (route, params) or None. """
+        (route, params, _) = self.match(path, method)
+        if route is None:
+            return None
+
+        return (route.handler, params)
+
+    def match(self, path, method="GET"):
+        """ For a given path return (route, params, allowed).
+            The route is the matched Route, which holds the handler along
+            with the registered path, name, and options.
+            A HEAD request is matched to the GET route if there isn't a HEAD
+            one.  If no route exists for the method, route and params are
+            None and allowed is the set of methods the path does have routes
+            for, so an empty allowed means the path wasn't found at all.
+        """
         method = method.upper()
+
+        if self._cache is None and self._negative_cache is None:
+            return self._match(path, method)
+
+        key = (method, path)
+        if self._cache is not None:
+            result = self._cache.get(key)
+            if result is not None:
+                return (result[0], dict(result[1]), result[2])
+
+        if self._negative_cache is not None:
+            result = self._negative_cache.get(key)
+            if result is not None:
+                return result
+
+        result = self._match(path, method)
+        if result[0] is None:
+            if self._negative_cache is not None:
+                self._negative_cache.set(key, result)
+        elif self._cache is not None:
+            self._cache.set(key, (result[0], dict(result[1]), result[2]))
+
+        return result
+
+    def _match(self, path, method):
+        """ Find the route without using the caches. """
+        if self._compiled is not None:
+            return self._match_compiled(path, method)
+
         parts = path.split("/")
         # Keep leading blanks as well to be able to match empty PATHINFO
 
-        if method not in self._routes:
-            return None
+        allowed = set()
+        result = self._routes.find_match(parts, {}, method, allowed)
+        if result is None:
+            return (None, None, _allowed(allowed))
+
+        return (result[0], result[1], frozenset())
+
+    def _match_compiled(self, path, method):
+        """ Find the route using the compiled routes. """
+        (static, segment) = self._compiled
+
+        routes = static.get(path)
+        if routes is not None:
+            route = _method_route(routes, method)
+            if route is not None:
+                return (route, {}, frozenset())
+
+        parts = path.split("/")
+        captured = []
+        allowed = set()
+        route = segment.find_match(
+            parts, len(parts), path, 0, 0, method, captured, allowed
+        )
+        if route is None:
+            return (None, None, _allowed(allowed))
 
         params = {}
-        return self._routes[method].find_match(parts, params)
+        for matched in captured:
+            params.update(matched)
 
-    def get(self, name, params, method="GET"):
-        """ Get a path from a named entry. """
-        method = method.upper()
-        if method not in self._named:
-            raise RouteError("No such named path: " + name)
+        return (route, params, frozenset())
 
-        if name not in self._named[method]:
+    def _get_builder(self, name, method):
+        """ Find the url builder of a named entry. """
+        try:
+            return self._named[method.upper()][name]
+        except KeyError:
             raise RouteError("No such named path: " + name)
 
-        def subfn(mo):
-            key = mo.group(1)
-            if key not in params:
-                raise RouteError("No parameter for named path: " + key)
-
-            return str(params[key])
+    def get(self, name, params, method="GET", query=None, quote=False):
+        """ Get a path from a named entry.
+            If quote is set, the values are percent-encoded.  If query is
+            given, it is encoded and appended as the query string.
+        """
+        path = self._get_builder(name, method).build(params, quote)
+        if query:
+            path = path + "?" + urlencode(query, doseq=True)
 
-        return self._NAMED_REPLACE_RE.sub(subfn, self._named[method][name])
+        return path
 
+    def get_many(self, name, params_list, method="GET", query=None, quote=False):
+        """ Get a list of paths from a named entry, one for each params. """
+        build = self._get_builder(name, method).build
+        if query:
+            query = "?" + urlencode(query, doseq=True)
+            return [build(params, quote) + query for params in params_list]
 
+        return [build(params, quote) for params in params_list]
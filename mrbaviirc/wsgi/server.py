@@ -0,0 +1,448 @@
+""" Pre-fork HTTP/1.1 server. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["PreforkServer"]
+
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import random
+import select
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from urllib.parse import unquote
+from wsgiref.handlers import SimpleHandler
+
+from .error import AppError
+
+
+class _Input:
+    """ wsgi.input limited to the Content-Length of the request. """
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def drain(self, limit):
+        """ Skip the unread body.  Return False if more than limit is left. """
+        if self.remaining > limit:
+            return False
+
+        while self.remaining > 0:
+            if not self.read(65536):
+                return False
+        return True
+
+
+class _ServerHandler(SimpleHandler):
+    """ Run the app for one request of a connection. """
+
+    http_version = "1.1"
+    os_environ = {} # Don't copy the process environment into each request
+
+    def __init__(self, request_handler, *args, **kwargs):
+        SimpleHandler.__init__(self, *args, **kwargs)
+        self.request_handler = request_handler
+
+    def cleanup_headers(self):
+        SimpleHandler.cleanup_headers(self)
+
+        # Without a length the end of the body is marked by closing
+        code = int(self.status[:3])
+        if code >= 200 and code not in (204, 304) and "Content-Length" not in self.headers:
+            self.request_handler.close_connection = True
+
+        if self.request_handler.server.draining:
+            self.request_handler.close_connection = True
+
+        if self.request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+    def write(self, data):
+        # Send the headers but no body for HEAD
+        if self.environ["REQUEST_METHOD"] == "HEAD":
+            data = b""
+        SimpleHandler.write(self, data)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """ Handle the requests of a keep-alive connection. """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "mrbaviirc.wsgi"
+
+    def setup(self):
+        self.timeout = self.server.keepalive
+        BaseHTTPRequestHandler.setup(self)
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            # An idle keep-alive connection
+            self.close_connection = True
+            return
+
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            return
+
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+
+        if not self.parse_request():
+            return
+
+        encoding = self.headers.get("Transfer-Encoding", "identity").lower()
+        if encoding != "identity":
+            self.close_connection = True
+            self.send_error(411, "Chunked request bodies are not supported")
+            return
+
+        try:
+            length = max(0, int(self.headers.get("Content-Length", 0)))
+        except ValueError:
+            self.close_connection = True
+            self.send_error(400, "Invalid Content-Length")
+            return
+
+        server = self.server
+        wsgi_input = _Input(self.rfile, length)
+        handler = _ServerHandler(
+            self, wsgi_input, self.wfile, sys.stderr, self.get_environ(),
+            multithread=True, multiprocess=True
+        )
+        handler.run(server.app)
+
+        # The next request starts after this body
+        if not wsgi_input.drain(server.max_drain):
+            self.close_connection = True
+
+        self.wfile.flush()
+
+    def get_environ(self):
+        """ Create the environ of the request without the wsgi.* keys. """
+        (path, _, query) = self.path.partition("?")
+        environ = {
+            "REQUEST_METHOD": self.command,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path, "iso-8859-1"),
+            "QUERY_STRING": query,
+            "REQUEST_URI": self.path,
+            "SERVER_NAME": self.server.server_name,
+            "SERVER_PORT": str(self.server.server_port),
+            "SERVER_PROTOCOL": self.request_version,
+            "SERVER_SOFTWARE": self.server_version,
+            "REMOTE_ADDR": self.client_address[0]
+        }
+
+        for (name, value) in self.headers.items():
+            if "_" in name:
+                continue # Would look the same as a name with "-"
+
+            key = name.upper().replace("-", "_")
+            if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                key = "HTTP_" + key
+
+            if key in environ:
+                sep = "; " if key == "HTTP_COOKIE" else ","
+                environ[key] += sep + value
+            else:
+                environ[key] = value
+
+        return environ
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        # App errors are logged by the app, and connection errors such as
+        # keep-alive timeouts are routine
+        pass
+
+
+class _WorkerServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ Serve connections from an already listening socket. """
+
+    daemon_threads = False
+    block_on_close = True # server_close waits for connections to finish
+
+    def __init__(self, sock, app, keepalive, max_drain):
+        HTTPServer.__init__(
+            self, sock.getsockname()[:2], _RequestHandler, bind_and_activate=False
+        )
+        self.socket.close()
+        self.socket = sock
+
+        (host, port) = sock.getsockname()[:2]
+        self.server_name = host if host not in ("", "0.0.0.0", "::") else socket.gethostname()
+        self.server_port = port
+
+        self.app = app
+        self.draining = False
+        self.keepalive = keepalive
+        self.max_drain = max_drain
+
+    def handle_error(self, request, client_address):
+        # Clients going away is routine
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class PreforkServer:
+    """ Serve a WsgiApp from a number of forked worker processes.
+        The master process calls the app's startup once and then forks the
+        workers.  With SO_REUSEPORT, each worker listens on its own socket
+        and the kernel spreads connections between them, otherwise they all
+        accept from one socket made by the master.  Each worker handles
+        HTTP/1.1 keep-alive connections in threads.
+
+        Workers that exit are restarted.  SIGHUP replaces all workers with
+        new ones, calling on_reload in the master first if given, while the
+        old ones finish their requests.  SIGTERM and SIGINT stop accepting
+        connections and wait up to graceful_timeout seconds for the
+        workers to finish.  Each worker, and finally the master, calls the
+        app's shutdown.  Resources that can't be shared by forked processes
+        should be created by the app on first use instead of in startup.
+    """
+
+    def __init__(self, app, host, port, workers=None, backlog=1024, keepalive=5.0,
+                 graceful_timeout=30.0, max_drain=1048576, reuse_port=None,
+                 on_reload=None):
+        """ Initialize the server. """
+        if not hasattr(os, "fork"):
+            raise AppError("The pre-fork server needs os.fork")
+
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.backlog = backlog
+        self.keepalive = keepalive
+        self.graceful_timeout = graceful_timeout
+        self.max_drain = max_drain # Largest unread body skipped to keep alive
+        self.on_reload = on_reload
+        if reuse_port is None:
+            reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.reuse_port = reuse_port
+
+        self._socket = None
+        self._children = {} # pid: start time of current workers
+        self._retiring = set() # pids of workers being replaced
+        self._signals = []
+        self._wakeup = None
+
+    def _bind(self, listen):
+        """ Create a socket bound to the address. """
+        (family, kind, proto, _, address) = socket.getaddrinfo(
+            self.host, self.port, 0, socket.SOCK_STREAM, 0, socket.AI_PASSIVE
+        )[0]
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(address)
+            if listen:
+                sock.listen(self.backlog)
+        except BaseException:
+            sock.close()
+            raise
+
+        return sock
+
+    def serve(self):
+        """ Run the master process until SIGTERM or SIGINT. """
+        if not self.app.started:
+            self.app.startup()
+
+        # With SO_REUSEPORT the master's socket only reserves the port, it
+        # doesn't listen so no connections are queued on it
+        self._socket = self._bind(not self.reuse_port)
+        if self.port == 0:
+            self.port = self._socket.getsockname()[1]
+
+        (read_fd, write_fd) = os.pipe()
+        os.set_blocking(write_fd, False)
+        self._wakeup = (read_fd, write_fd)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self._signal)
+
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            self._run()
+        finally:
+            self._stop()
+            self._socket.close()
+            os.close(read_fd)
+            os.close(write_fd)
+            self.app.shutdown()
+
+    def _signal(self, signum, frame):
+        self._signals.append(signum)
+        try:
+            os.write(self._wakeup[1], b"\0")
+        except OSError:
+            pass
+
+    def _run(self):
+        """ The master loop. """
+        while True:
+            select.select([self._wakeup[0]], [], [], 1.0)
+            try:
+                os.read(self._wakeup[0], 1024)
+            except BlockingIOError:
+                pass
+
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    return
+                if signum == signal.SIGHUP:
+                    self._reload()
+
+            self._reap()
+
+    def _reap(self):
+        """ Collect exited workers and replace crashed ones. """
+        while True:
+            try:
+                (pid, _) = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            self._retiring.discard(pid)
+            started = self._children.pop(pid, None)
+            if started is not None:
+                # Slow down if workers die right after starting
+                if time.monotonic() - started < 1.0:
+                    time.sleep(1.0)
+                self._spawn()
+
+    def _reload(self):
+        """ Replace all workers with new ones. """
+        if self.on_reload is not None:
+            self.on_reload(self.app)
+
+        old = list(self._children)
+        self._children.clear()
+        self._retiring.update(old)
+
+        for _ in range(self.workers):
+            self._spawn()
+        for pid in old:
+            self._kill(pid, signal.SIGTERM)
+
+    def _stop(self):
+        """ Drain and stop all workers. """
+        pids = set(self._children) | self._retiring
+        self._children.clear()
+        for pid in pids:
+            self._kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while pids and time.monotonic() < deadline:
+            for pid in list(pids):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                        pids.discard(pid)
+                except ChildProcessError:
+                    pids.discard(pid)
+            time.sleep(0.05)
+
+        for pid in pids:
+            self._kill(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self._retiring.clear()
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _spawn(self):
+        """ Fork a worker. """
+        pid = os.fork()
+        if pid != 0:
+            self._children[pid] = time.monotonic()
+            return
+
+        # In the worker
+        code = 1
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            os.close(self._wakeup[0])
+            os.close(self._wakeup[1])
+            random.seed()
+
+            self._worker()
+            code = 0
+        except BaseException: # pylint: disable=broad-except
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(code) # pylint: disable=protected-access
+
+    def _worker(self):
+        """ Serve requests until SIGTERM. """
+        if self.reuse_port:
+            self._socket.close()
+            sock = self._bind(True)
+        else:
+            sock = self._socket
+
+        server = _WorkerServer(sock, self.app, self.keepalive, self.max_drain)
+
+        def drain(signum, frame):
+            server.draining = True
+            threading.Thread(target=server.shutdown).start()
+
+        signal.signal(signal.SIGTERM, drain)
+        signal.signal(signal.SIGINT, drain)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        try:
+            server.serve_forever(0.5)
+        finally:
+            server.server_close() # Waits for open connections
+            self.app.shutdown()
@@ -0,0 +1,235 @@
+""" Serve static files. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["StaticFiles"]
+
+
+import mimetypes
+import os
+import stat
+import time
+
+from .cache import LruCache
+from .content import FileContent
+from .headers import etag_matches, http_date, parse_accept, parse_http_date
+
+
+class _StaticFile:
+    """ The cached stat results of a file and its gzip sibling. """
+
+    __slots__ = ("filename", "size", "mtime", "etag", "last_modified",
+                 "content_type", "gzip", "checked")
+
+    def __init__(self, filename, stat_result, content_type, gzip, checked):
+        self.filename = filename
+        self.size = stat_result.st_size
+        self.mtime = int(stat_result.st_mtime)
+        self.etag = '"{0:x}-{1:x}"'.format(stat_result.st_mtime_ns, self.size)
+        self.last_modified = http_date(self.mtime)
+        self.content_type = content_type
+        self.gzip = gzip # _StaticFile of the .gz sibling or None
+        self.checked = checked
+
+
+class StaticFiles:
+    """ A route that serves the files under a directory.
+        The route must be registered with a <path:path> variable, which is
+        the file to serve relative to the directory.  Stat results and
+        ETags are cached for stat_ttl seconds, so conditional requests are
+        answered without touching the file system.  Files are not
+        compressed by the app, but a precompressed .gz sibling is served to
+        clients that accept gzip.
+    """
+
+    def __init__(self, directory, cache_size=1024, stat_ttl=2.0, max_age=None,
+                 precompressed=True, param="path"):
+        """ Initialize the static files route. """
+        self.directory = os.path.abspath(directory)
+        self.stat_ttl = stat_ttl
+        self.max_age = max_age
+        self.precompressed = precompressed
+        self.param = param
+
+        self._cache = LruCache(cache_size)
+
+    def __call__(self, exchange):
+        """ Serve the requested file. """
+        request = exchange.request
+        response = exchange.response
+        environ = exchange.environ
+
+        info = self._lookup(str(request.params.get(self.param, "")))
+        if info is None:
+            exchange.app.handle_notfound(exchange)
+            return
+
+        # Files are sent as they are, with the ETag and Vary of the file
+        response.compress = False
+
+        # Serve the precompressed sibling if the client accepts it
+        if info.gzip is not None:
+            response.headers["Vary"] = "Accept-Encoding"
+            if parse_accept(environ.get("HTTP_ACCEPT_ENCODING")).get("gzip", 0) > 0:
+                response.headers["Content-Encoding"] = "gzip"
+                info = info.gzip
+
+        response.content_type = info.content_type
+        response.headers["ETag"] = info.etag
+        response.headers["Last-Modified"] = info.last_modified
+        response.headers["Accept-Ranges"] = "bytes"
+        if self.max_age is not None:
+            response.headers["Cache-Control"] = "max-age={0}".format(self.max_age)
+
+        if self._not_modified(environ, info):
+            response.status = 304
+            response.content = b""
+            return
+
+        (offset, length) = (0, info.size)
+        byte_range = self._get_range(environ, info)
+        if byte_range is False:
+            response.status = 416
+            response.headers["Content-Range"] = "bytes */{0}".format(info.size)
+            response.content = b""
+            return
+
+        if byte_range is not None:
+            (offset, length) = byte_range
+            response.status = 206
+            response.headers["Content-Range"] = "bytes {0}-{1}/{2}".format(
+                offset, offset + length - 1, info.size
+            )
+        else:
+            response.status = 200
+
+        if request.method == "HEAD":
+            response.headers["Content-Length"] = str(length)
+            response.content = b""
+            return
+
+        response.content = FileContent(info.filename, offset, length)
+
+    def _lookup(self, path):
+        """ Find the cached information for a relative path. """
+        now = time.monotonic()
+        info = self._cache.get(path)
+        if info is not None and now - info.checked < self.stat_ttl:
+            return info
+
+        filename = self._resolve(path)
+        info = None
+        if filename is not None:
+            info = self._stat(filename, now)
+
+        if info is None:
+            self._cache.pop(path)
+            return None
+
+        self._cache.set(path, info)
+        return info
+
+    def _resolve(self, path):
+        """ Convert the relative path to a filename inside the directory. """
+        if "\0" in path or "\\" in path:
+            return None
+
+        parts = [part for part in path.split("/") if part and part != "."]
+        if any(part == ".." for part in parts):
+            return None
+
+        filename = os.path.join(self.directory, *parts)
+        if not filename.startswith(self.directory):
+            return None
+
+        return filename
+
+    def _stat(self, filename, now):
+        """ Stat a file and its gzip sibling. """
+        try:
+            result = os.stat(filename)
+        except (OSError, ValueError):
+            return None
+
+        if not stat.S_ISREG(result.st_mode):
+            return None
+
+        (content_type, encoding) = mimetypes.guess_type(filename)
+        if content_type is None or encoding is not None:
+            content_type = "application/octet-stream"
+
+        gzip = None
+        if self.precompressed:
+            gzip = self._stat_gzip(filename + ".gz", content_type, result, now)
+
+        return _StaticFile(filename, result, content_type, gzip, now)
+
+    @staticmethod
+    def _stat_gzip(filename, content_type, original, now):
+        """ Stat a gzip sibling, ignoring any older than the original. """
+        try:
+            result = os.stat(filename)
+        except (OSError, ValueError):
+            return None
+
+        if not stat.S_ISREG(result.st_mode) or result.st_mtime < original.st_mtime:
+            return None
+
+        info = _StaticFile(filename, result, content_type, None, now)
+        info.etag = info.etag[:-1] + '-gz"' # Never the same as the original
+        return info
+
+    @staticmethod
+    def _not_modified(environ, info):
+        """ Test the conditional request headers. """
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, info.etag)
+
+        since = parse_http_date(environ.get("HTTP_IF_MODIFIED_SINCE"))
+        return since is not None and info.mtime <= since
+
+    @staticmethod
+    def _get_range(environ, info):
+        """ Parse a single byte range request.
+            Return value is (offset, length), None to send the whole file,
+            or False if the range can't be satisfied.
+        """
+        header = environ.get("HTTP_RANGE")
+        if not header or not header.startswith("bytes=") or "," in header:
+            return None
+
+        # A range only applies if the If-Range validator still matches
+        if_range = environ.get("HTTP_IF_RANGE")
+        if if_range and if_range != info.etag and if_range != info.last_modified:
+            return None
+
+        (start, sep, end) = header[6:].strip().partition("-")
+        if not sep:
+            return None
+
+        size = info.size
+        try:
+            if not start:
+                # The last "end" bytes
+                length = int(end)
+                if length <= 0:
+                    return False
+                start = max(0, size - length)
+                end = size - 1
+            else:
+                start = int(start)
+                end = int(end) if end else size - 1
+        except ValueError:
+            return None
+
+        if start >= size or end < start:
+            return False
+
+        end = min(end, size - 1)
+        return (start, end - start + 1)
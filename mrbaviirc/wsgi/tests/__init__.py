@@ -0,0 +1,57 @@
+""" Helpers shared by the tests. """
+
+
+import io
+import time
+from types import SimpleNamespace
+
+from ..headers import Headers
+
+
+def make_exchange(path="/", method="GET", route=None, status=200, content_length=None,
+                  duration=0.0, query="", **environ):
+    """ Create a stand-in exchange with the attributes the modules use. """
+    environ.setdefault("REQUEST_METHOD", method)
+    environ.setdefault("PATH_INFO", path)
+    return SimpleNamespace(
+        route=route,
+        environ=environ,
+        timer=time.monotonic() - duration,
+        request=SimpleNamespace(
+            method=method, script_name="", path_info=path, query_string=query
+        ),
+        response=SimpleNamespace(
+            status=status, content_length=content_length, headers=Headers(),
+            cookies={}, content_type=None, content=()
+        )
+    )
+
+
+def call_app(app, path, method="GET", body=b"", **environ):
+    """ Call a WSGI app and return the status, a dict of headers and the body. """
+    environ.update({
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": environ.get("QUERY_STRING", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": io.StringIO()
+    })
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started.append((status, headers))
+
+    result = app(environ, start_response)
+    try:
+        data = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    (status, headers) = started[-1]
+    return (status, dict(headers), data)
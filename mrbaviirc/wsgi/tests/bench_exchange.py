@@ -0,0 +1,80 @@
+""" Measure the allocations and time of an exchange.
+
+    Not collected by pytest, run it with:
+
+        python -m mrbaviirc.wsgi.tests.bench_exchange [count]
+
+    It creates, starts, and finalizes count exchanges for a plain GET with a
+    bytes body, and prints the allocations they keep alive and the time
+    each one takes.  Run it on two commits to compare them.
+"""
+
+
+import io
+import sys
+import time
+import tracemalloc
+
+from ..app import WsgiApp
+
+
+def _environ():
+    return {
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": "/a/1",
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr
+    }
+
+
+def _exchange(app, environ):
+    exchange = app.create_exchange(environ)
+    exchange.start()
+    exchange.response.status = 200
+    exchange.response.content = b"hello"
+    exchange.finalize()
+    return exchange
+
+
+def main(count=10000):
+    app = WsgiApp()
+    app.startup()
+    _exchange(app, _environ()) # Warm up any lazily created state
+
+    # Retained allocations of the exchanges kept alive, not their environs
+    environs = [_environ() for _ in range(count)]
+    exchanges = [None] * count
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for (index, environ) in enumerate(environs):
+        exchanges[index] = _exchange(app, environ)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del exchanges
+
+    environs = [_environ() for _ in range(count)]
+    start = time.perf_counter()
+    for environ in environs:
+        _exchange(app, environ)
+    elapsed = time.perf_counter() - start
+
+    print("exchanges                          {0}".format(count))
+    print("retained allocations per exchange  {0:.0f} blocks / {1:.0f} bytes".format(
+        blocks / count, size / count
+    ))
+    print("time per exchange                  {0:.1f} us".format(elapsed / count * 1e6))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,61 @@
+""" Test the access module. """
+
+
+import io
+import json
+
+from . import call_app, make_exchange
+from ..access import AccessLog
+from ..app import WsgiApp
+from ..router import Route
+
+
+def _entries(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_access_log():
+    stream = io.StringIO()
+    log = AccessLog(stream, size=2)
+    log.start()
+
+    route = Route(None, "GET", "/a/<int:id>", "item", {})
+    log.log(make_exchange("/a/1", route=route, content_length=5))
+    log.log(make_exchange("/a/1", status=404))
+    log.log(make_exchange("/a/1")) # Dropped, the buffer is full unless already written
+    log.stop()
+
+    entries = _entries(stream)
+    assert len(entries) + log.dropped == 3
+    assert entries[0]["route"] == "item"
+    assert entries[0]["pattern"] == "/a/<int:id>"
+    assert (entries[0]["status"], entries[0]["bytes"]) == (200, 5)
+    assert entries[0]["duration"] >= 0
+    assert (entries[1]["route"], entries[1]["status"], entries[1]["bytes"]) == (None, 404, None)
+
+
+def test_app_access_log():
+    app = WsgiApp()
+    stream = io.StringIO()
+    app.access_log = AccessLog(stream)
+
+    @app.route("/a/<name>", name="a")
+    def handler(exchange):
+        exchange.response.status = 200
+        exchange.response.content = "hello"
+
+    @app.route("/c")
+    def unknown_status(exchange):
+        exchange.response.status = 299 # Fails once the response is encoded
+
+    app.startup()
+    call_app(app, "/a/x", REMOTE_ADDR="127.0.0.1")
+    call_app(app, "/b")
+    assert call_app(app, "/c")[0] == "500 Internal Server Error"
+    app.shutdown()
+
+    entries = _entries(stream)
+    assert [(entry["path"], entry["route"], entry["status"]) for entry in entries] == [
+        ("/a/x", "a", 200), ("/b", None, 404), ("/c", None, 500)
+    ]
+    assert (entries[0]["bytes"], entries[0]["remote"]) == (5, "127.0.0.1")
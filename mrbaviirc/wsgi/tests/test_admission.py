@@ -0,0 +1,134 @@
+""" Test the admission module. """
+
+
+import asyncio
+import threading
+import time
+
+from . import call_app
+from ..admission import AdmissionControl
+from ..app import WsgiApp
+from ..router import Route
+
+
+def test_admission():
+    admission = AdmissionControl(limit=1, queue=1, timeout=1.0)
+    assert admission.acquire()
+    assert not admission.try_acquire()
+
+    # One request may wait for the slot, the next is rejected at once
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(admission.acquire()))
+    waiter.start()
+    while admission.stats()["global"]["waiting"] == 0:
+        time.sleep(0.001)
+
+    assert not admission.acquire()
+    admission.release()
+    waiter.join()
+    admission.release()
+
+    stats = admission.stats()["global"]
+    assert results == [True]
+    assert (stats["admitted"], stats["rejected"], stats["queued"]) == (2, 1, 1)
+    assert stats["in_flight"] == 0
+
+
+def test_route_limits():
+    admission = AdmissionControl(timeout=0.01)
+    limited = Route(None, "GET", "/slow", None, {"concurrency": 1})
+    unlimited = Route(None, "GET", "/fast", None, {})
+
+    assert admission.acquire(limited)
+    assert not admission.acquire(limited)
+    assert admission.acquire(unlimited)
+    admission.release(limited)
+    assert admission.acquire(limited)
+
+    assert list(admission.stats()) == ["GET /slow"]
+    assert 'http_admission_rejected_total{limit="GET /slow"} 1' in admission.prometheus()
+
+
+def test_app_overloaded():
+    app = WsgiApp()
+    app.config.set("webapp.admission.enabled", True)
+    app.config.set("webapp.admission.limit", 1)
+    app.config.set("webapp.admission.retry_after", 5)
+    nested = []
+
+    @app.route("/a")
+    def handler(exchange):
+        # The only slot is taken by this request
+        nested.append(call_app(app, "/a"))
+        exchange.response.status = 200
+        exchange.response.content = "ok"
+
+    app.startup()
+    (status, _, body) = call_app(app, "/a")
+    assert (status, body) == ("200 OK", b"ok")
+
+    (status, headers, _) = nested[0]
+    assert status.startswith("503")
+    assert headers["Retry-After"] == "5"
+    assert app.admission.stats()["global"]["rejected"] == 1
+
+
+def test_async_admission():
+    admission = AdmissionControl(limit=1, queue=1, timeout=0.1)
+
+    async def run():
+        assert await admission.aacquire()
+        waiter = asyncio.ensure_future(admission.aacquire())
+        await asyncio.sleep(0.01)
+        assert admission.stats()["global"]["waiting"] == 1
+        assert not await admission.aacquire() # The queue is full
+
+        # The slot is handed to the waiting coroutine from another thread
+        threading.Thread(target=admission.release).start()
+        assert await waiter
+        assert not await admission.aacquire() # Times out
+        admission.release()
+
+    asyncio.run(run())
+    stats = admission.stats()["global"]
+    assert (stats["in_flight"], stats["waiting"]) == (0, 0)
+    assert (stats["admitted"], stats["rejected"], stats["queued"]) == (2, 2, 1)
+
+
+def test_asgi_overloaded():
+    app = WsgiApp()
+    app.config.set("webapp.asgi.threads", 2)
+    app.config.set("webapp.admission.enabled", True)
+    app.config.set("webapp.admission.limit", 2)
+    app.config.set("webapp.admission.queue", 2)
+
+    @app.route("/a")
+    def handler(exchange):
+        time.sleep(0.1)
+        exchange.response.status = 200
+
+    app.startup()
+
+    async def request():
+        scope = {"type": "http", "method": "GET", "path": "/a", "headers": []}
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        start = time.monotonic()
+        await app.asgi(scope, receive, send)
+        return (sent[0]["status"], time.monotonic() - start)
+
+    async def run():
+        return await asyncio.gather(*(request() for _ in range(12)))
+
+    results = asyncio.run(run())
+
+    # Waiting requests don't hold pool threads, so the rest are turned away at once
+    assert sorted(status for (status, _) in results) == [200] * 4 + [503] * 8
+    assert max(duration for (status, duration) in results if status == 503) < 0.1
+    assert max(duration for (status, duration) in results if status == 200) < 0.5
@@ -0,0 +1,138 @@
+""" Test the ASGI adapter. """
+
+
+import asyncio
+import io
+import json
+import threading
+
+from ..access import AccessLog
+from ..app import WsgiApp
+
+
+def _create_app():
+    app = WsgiApp()
+
+    @app.route("/sync")
+    def sync(exchange):
+        exchange.response.status = 200
+        exchange.response.content = threading.current_thread().name
+
+    @app.route("/async/<name>")
+    async def async_(exchange):
+        await asyncio.sleep(0)
+        exchange.response.status = 200
+        exchange.response.content = "hello " + exchange.request.params["name"]
+
+    @app.route("/echo", method="POST")
+    async def echo(exchange):
+        body = await exchange.request.read_body()
+        exchange.response.status = 200
+        exchange.response.content = body
+
+    @app.route("/sync-echo", method="POST")
+    def sync_echo(exchange):
+        exchange.response.status = 200
+        exchange.response.content = exchange.request.body
+
+    @app.route("/json", method="POST")
+    def json_body(exchange):
+        exchange.response.status = 200
+        exchange.response.content = repr(exchange.request.json)
+
+    @app.route("/stream")
+    async def stream(exchange):
+        async def chunks():
+            for value in ("a", "b", "c"):
+                yield value
+
+        exchange.response.status = 200
+        exchange.response.stream(chunks())
+
+    app.startup()
+    return app
+
+
+def _request(app, path, method="GET", chunks=(b"",), headers=(), length=True):
+    chunks = list(chunks)
+    headers = list(headers)
+    if length:
+        headers.append((b"content-length", str(sum(map(len, chunks))).encode()))
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": headers,
+        "server": ("localhost", 80)
+    }
+    sent = []
+
+    async def receive():
+        if chunks:
+            return {"type": "http.request", "body": chunks.pop(0), "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app.asgi(scope, receive, send))
+
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return (sent[0]["status"], body)
+
+
+def test_asgi():
+    app = _create_app()
+
+    (status, body) = _request(app, "/sync")
+    assert status == 200
+    assert body.startswith(b"mrbaviirc.wsgi.asgi")
+
+    assert _request(app, "/async/world") == (200, b"hello world")
+    assert _request(app, "/echo", "POST", [b"one ", b"two"]) == (200, b"one two")
+    assert _request(app, "/stream") == (200, b"abc")
+    assert _request(app, "/missing")[0] == 404
+
+    json_type = [(b"content-type", b"application/json")]
+    assert _request(app, "/json", "POST", [b"[1]"], json_type) == (200, b"[1]")
+    assert _request(app, "/json", "POST", [b"[1"], json_type)[0] == 400
+
+    # Routes record whether their handler is async
+    assert app.router.match("/async/x")[0].is_async
+
+
+def test_asgi_without_length():
+    app = _create_app()
+    app.request_limits.max_body = 10
+
+    # Such as a chunked HTTP/1.1 or an HTTP/2 body
+    for path in ("/echo", "/sync-echo"):
+        assert _request(app, path, "POST", [b"one ", b"two"], length=False) == \
+            (200, b"one two")
+        assert _request(app, path, "POST", [b"one ", b"two ", b"three"], length=False)[0] == 413
+
+
+def test_asgi_access_log():
+    app = WsgiApp()
+    stream = io.StringIO()
+    app.access_log = AccessLog(stream)
+
+    @app.route("/a")
+    def handler(exchange):
+        exchange.response.status = 200
+        exchange.response.content = "hello"
+
+    @app.route("/b")
+    def unknown_status(exchange):
+        exchange.response.status = 299 # Fails once the response is encoded
+
+    app.startup()
+    assert _request(app, "/a") == (200, b"hello")
+    assert _request(app, "/b")[0] == 500
+    app.shutdown()
+
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(entry["path"], entry["status"]) for entry in entries] == [("/a", 200), ("/b", 500)]
+    assert entries[0]["bytes"] == 5
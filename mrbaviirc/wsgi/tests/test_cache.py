@@ -0,0 +1,144 @@
+""" Test the cache module. """
+
+
+import threading
+import time
+
+from . import call_app, make_exchange
+from ..app import WsgiApp
+from ..cache import LruCache, MemoryCacheBackend, ResponseCache
+
+
+def test_lru():
+    cache = LruCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_backend():
+    backend = MemoryCacheBackend(4)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, -1)
+
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+
+
+def test_response_cache():
+    cache = ResponseCache(vary=("Accept-Language",), stale_ttl=60)
+    calls = []
+
+    def handler(exchange):
+        calls.append(exchange)
+        exchange.response.status = 200
+        exchange.response.content = "hello {0}".format(len(calls))
+
+    assert cache.make_key(make_exchange("/a", query="b=2&a=1")) == \
+        cache.make_key(make_exchange("/a", query="a=1&b=2"))
+    assert cache.make_key(make_exchange("/a", HTTP_ACCEPT_LANGUAGE="de")) != \
+        cache.make_key(make_exchange("/a", HTTP_ACCEPT_LANGUAGE="en"))
+
+    cache.handle(make_exchange("/a"), handler, 60)
+    for _ in range(2):
+        exchange = make_exchange("/a")
+        cache.handle(exchange, handler, 60)
+        assert exchange.response.content == b"hello 1"
+    assert len(calls) == 1
+
+    # Stale entries are regenerated
+    cache.handle(make_exchange("/b"), handler, 0.01)
+    time.sleep(0.02)
+    exchange = make_exchange("/b")
+    cache.handle(exchange, handler, 0.01)
+    assert exchange.response.content == "hello 3"
+    assert len(calls) == 3
+
+    # Responses with cookies are not kept
+    def cookie(exchange):
+        handler(exchange)
+        exchange.response.cookies["a"] = "b"
+
+    cache.handle(make_exchange("/c"), cookie, 60)
+    cache.handle(make_exchange("/c"), cookie, 60)
+    assert len(calls) == 5
+
+
+def test_single_flight():
+    cache = ResponseCache(wait_timeout=0.2)
+    release = threading.Event()
+    calls = []
+
+    def handler(exchange):
+        calls.append(exchange.request.path_info)
+        if exchange.request.path_info == "/slow":
+            release.wait(5.0)
+        exchange.response.status = 200
+        exchange.response.content = "hello"
+
+    exchanges = [make_exchange("/slow") for _ in range(2)]
+    threads = [
+        threading.Thread(target=cache.handle, args=(exchange, handler, 60))
+        for exchange in exchanges
+    ]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.01)
+    threads[1].start()
+
+    # Other keys don't wait for the slow one
+    for path in ("/a", "/b", "/c"):
+        cache.handle(make_exchange(path), handler, 60)
+    assert calls == ["/slow", "/a", "/b", "/c"]
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls.count("/slow") == 1
+    assert [exchange.response.content for exchange in exchanges] == ["hello", b"hello"]
+
+    # A waiter runs the handler itself once wait_timeout is over
+    started = threading.Event()
+
+    def blocking(exchange):
+        if not started.is_set():
+            started.set()
+            release.wait(5.0)
+        exchange.response.status = 200
+        exchange.response.content = "late"
+
+    release.clear()
+    thread = threading.Thread(target=cache.handle, args=(make_exchange("/d"), blocking, 60))
+    thread.start()
+    started.wait(5.0)
+
+    start = time.monotonic()
+    exchange = make_exchange("/d")
+    cache.handle(exchange, blocking, 60)
+    assert exchange.response.content == "late"
+    assert 0.2 <= time.monotonic() - start < 2.0
+
+    release.set()
+    thread.join()
+
+def test_app_cache():
+    app = WsgiApp()
+    app.config.set("webapp.cache.enabled", True)
+    calls = []
+
+    @app.route("/a", cache=60)
+    def handler(exchange):
+        calls.append(exchange)
+        exchange.response.status = 200
+        exchange.response.content = "hello {0}".format(len(calls))
+
+    app.startup()
+    assert call_app(app, "/a")[2] == b"hello 1"
+    assert call_app(app, "/a")[2] == b"hello 1"
+    assert call_app(app, "/a", "POST")[0].startswith("405")
+    assert len(calls) == 1
@@ -0,0 +1,133 @@
+""" Test the compress module. """
+
+
+import gzip
+import zlib
+
+from . import call_app
+from ..app import WsgiApp
+from ..compress import Compressor
+
+
+_TEXT = "compress me " * 200
+
+
+def _create_app(tmp_path):
+    app = WsgiApp()
+    app.config.set("webapp.compress.enabled", True)
+    app.config.set("webapp.compress.min_size", 100)
+    app.config.set("webapp.etag", True)
+
+    (tmp_path / "a.txt").write_text(_TEXT)
+
+    @app.route("/text")
+    def text(exchange):
+        exchange.response.status = 200
+        exchange.response.content_type = "text/plain"
+        exchange.response.content = _TEXT
+
+    @app.route("/small")
+    def small(exchange):
+        exchange.response.status = 200
+        exchange.response.content_type = "text/plain"
+        exchange.response.content = "small"
+
+    @app.route("/image")
+    def image(exchange):
+        exchange.response.status = 200
+        exchange.response.content_type = "image/png"
+        exchange.response.content = b"\0" * 1000
+
+    @app.route("/stream")
+    def stream(exchange):
+        exchange.response.status = 200
+        exchange.response.stream((_TEXT for _ in range(3)), "text/plain")
+
+    @app.route("/file")
+    def file(exchange):
+        exchange.response.status = 200
+        exchange.response.send_file(str(tmp_path / "a.txt"))
+
+    app.startup()
+    return app
+
+
+def test_negotiate():
+    negotiate = Compressor._negotiate
+    assert negotiate("gzip, deflate") == "gzip"
+    assert negotiate("deflate;q=1.0, gzip;q=0.5") == "deflate"
+    assert negotiate("*") == "gzip"
+    assert negotiate("gzip;q=0, *;q=0.5") == "deflate"
+    assert negotiate("identity") is None
+    assert negotiate(None) is None
+
+
+def test_compress(tmp_path):
+    app = _create_app(tmp_path)
+
+    (status, headers, body) = call_app(app, "/text", HTTP_ACCEPT_ENCODING="gzip")
+    assert status == "200 OK"
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert headers["Content-Length"] == str(len(body))
+    assert gzip.decompress(body).decode() == _TEXT
+
+    # The ETag is weakened for the compressed body only
+    assert headers["ETag"].startswith('W/"')
+    (_, plain_headers, plain) = call_app(app, "/text")
+    assert plain.decode() == _TEXT
+    assert "Content-Encoding" not in plain_headers
+    assert plain_headers["Vary"] == "Accept-Encoding"
+    assert plain_headers["ETag"] == headers["ETag"][2:]
+
+    (_, headers, body) = call_app(app, "/text", HTTP_ACCEPT_ENCODING="deflate")
+    assert headers["Content-Encoding"] == "deflate"
+    assert zlib.decompress(body).decode() == _TEXT
+
+    # Small bodies and other types are sent as is
+    (_, headers, body) = call_app(app, "/small", HTTP_ACCEPT_ENCODING="gzip")
+    assert (body, headers["Vary"]) == (b"small", "Accept-Encoding")
+    assert "Content-Encoding" not in headers
+
+    (_, headers, _) = call_app(app, "/image", HTTP_ACCEPT_ENCODING="gzip")
+    assert "Content-Encoding" not in headers
+    assert "Vary" not in headers
+
+
+def test_stream(tmp_path):
+    app = _create_app(tmp_path)
+
+    (_, headers, body) = call_app(app, "/stream", HTTP_ACCEPT_ENCODING="gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in headers
+    assert gzip.decompress(body).decode() == _TEXT * 3
+
+
+def test_vary(tmp_path):
+    app = _create_app(tmp_path)
+
+    # Files are sent as is but still vary like other responses
+    (_, headers, body) = call_app(app, "/file", HTTP_ACCEPT_ENCODING="gzip")
+    assert body.decode() == _TEXT
+    assert "Content-Encoding" not in headers
+    assert headers["Vary"] == "Accept-Encoding"
+
+    etag = call_app(app, "/text")[1]["ETag"]
+    (status, headers, body) = call_app(app, "/text", HTTP_IF_NONE_MATCH=etag)
+    assert (status, body) == ("304 Not Modified", b"")
+    assert (headers["Vary"], headers["ETag"]) == ("Accept-Encoding", etag)
+
+
+def test_etag(tmp_path):
+    app = _create_app(tmp_path)
+
+    # A 304 has the same ETag as the response it stands for
+    for path in ("/text", "/small"):
+        etag = call_app(app, path, HTTP_ACCEPT_ENCODING="gzip")[1]["ETag"]
+        assert etag.startswith('W/"')
+
+        (status, headers, _) = call_app(
+            app, path, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+        )
+        assert (status, headers["ETag"]) == ("304 Not Modified", etag)
+        assert "Content-Encoding" not in headers
@@ -0,0 +1,97 @@
+""" Test the exchange module. """
+
+
+from . import call_app
+from ..app import WsgiApp
+
+
+def _create_app():
+    app = WsgiApp()
+
+    @app.route("/json", method="POST")
+    def json_body(exchange):
+        exchange.response.status = 200
+        exchange.response.content = repr(exchange.request.json)
+
+    @app.route("/form", method="POST")
+    def form(exchange):
+        exchange.response.status = 200
+        exchange.response.content = repr(sorted(exchange.request.post))
+
+    @app.route("/files", method="POST")
+    def files(exchange):
+        exchange.response.status = 200
+        exchange.response.content = repr(sorted(exchange.request.files))
+
+    app.config.set("webapp.upload.memory_limit", 1024)
+
+    app.startup()
+    return app
+
+
+def test_bad_request():
+    app = _create_app()
+
+    (status, _, body) = call_app(
+        app, "/json", "POST", b'{"a": 1}', CONTENT_TYPE="application/json"
+    )
+    assert (status, body) == ("200 OK", b"{'a': 1}")
+
+    (status, _, body) = call_app(
+        app, "/json", "POST", b'{"a": ', CONTENT_TYPE="application/json"
+    )
+    assert status == "400 Bad Request"
+    assert b"Invalid JSON request body" in body
+
+    # A multipart body without a boundary or with a truncated part
+    (status, _, _) = call_app(
+        app, "/form", "POST", b"--x\r\n", CONTENT_TYPE="multipart/form-data"
+    )
+    assert status == "400 Bad Request"
+
+    (status, _, _) = call_app(
+        app, "/form", "POST", b'--x\r\nContent-Disposition: form-data; name="a"\r\n\r\nvalue',
+        CONTENT_TYPE="multipart/form-data; boundary=x"
+    )
+    assert status == "400 Bad Request"
+
+
+def _multipart(filename, size):
+    disposition = 'form-data; name="a"'
+    if filename:
+        disposition += '; filename="{0}"'.format(filename)
+
+    return (
+        "--x\r\nContent-Disposition: {0}\r\n\r\n".format(disposition).encode()
+        + b"v" * size + b"\r\n--x--\r\n"
+    )
+
+
+def test_large_fields():
+    app = _create_app()
+    ctype = "multipart/form-data; boundary=x"
+
+    # Values are limited to the memory limit, files are spooled to disk
+    assert call_app(app, "/form", "POST", _multipart(None, 1000), CONTENT_TYPE=ctype)[2] == \
+        b"['a']"
+    (status, _, _) = call_app(app, "/form", "POST", _multipart(None, 5000), CONTENT_TYPE=ctype)
+    assert status.startswith("413")
+    assert call_app(app, "/files", "POST", _multipart("a.txt", 5000), CONTENT_TYPE=ctype)[2] == \
+        b"['a']"
+
+
+def test_head():
+    app = WsgiApp()
+
+    @app.route("/a")
+    def handler(exchange):
+        exchange.response.status = 200
+        exchange.response.content = "hello"
+
+    app.startup()
+    (status, headers, _) = call_app(app, "/a", "HEAD")
+    assert (status, headers["Content-Length"]) == ("200 OK", "5")
+
+    (status, headers, _) = call_app(app, "/a", "POST")
+    assert status.startswith("405")
+    assert headers["Allow"] == "GET, HEAD, OPTIONS"
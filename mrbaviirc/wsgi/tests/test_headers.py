@@ -0,0 +1,65 @@
+""" Test the headers module. """
+
+
+import pytest
+
+
+from ..headers import EnvironHeaders, Headers, etag_matches, parse_accept
+
+
+def test_headers():
+    headers = Headers({"Content-Type": "text/plain"})
+    headers.add("Set-Cookie", "a=1")
+    headers.add("Set-Cookie", "b=2")
+    headers["X-Test"] = "1"
+
+    assert "content-type" in headers
+    assert headers["SET-COOKIE"] == "a=1"
+    assert headers.get_all("set-cookie") == ["a=1", "b=2"]
+    assert len(headers) == 4
+
+    # Setting replaces all values in place
+    headers["set-cookie"] = "c=3"
+    assert headers.items() == [
+        ("Content-Type", "text/plain"), ("set-cookie", "c=3"), ("X-Test", "1")
+    ]
+
+    del headers["x-test"]
+    assert headers.get("X-Test") is None
+    with pytest.raises(KeyError):
+        del headers["X-Test"]
+
+    assert headers.setdefault("Vary", "Accept") == "Accept"
+    assert headers.setdefault("vary", "Cookie") == "Accept"
+
+
+def test_environ_headers():
+    environ = {
+        "HTTP_USER_AGENT": "test",
+        "HTTP_X_FORWARDED_FOR": "1.2.3.4",
+        "CONTENT_TYPE": "text/plain",
+        "PATH_INFO": "/"
+    }
+    headers = EnvironHeaders(environ)
+
+    assert headers["user-agent"] == "test"
+    assert headers["X-Forwarded-For"] == "1.2.3.4"
+    assert headers.get("Content-Type") == "text/plain"
+    assert "path-info" not in headers
+    assert headers.get("Accept") is None
+    with pytest.raises(KeyError):
+        headers["Accept"] # pylint: disable=pointless-statement
+
+    assert sorted(headers) == ["Content-Type", "User-Agent", "X-Forwarded-For"]
+    assert len(headers) == 3
+
+    # A view, not a copy
+    environ["HTTP_ACCEPT"] = "*/*"
+    assert headers["accept"] == "*/*"
+
+
+def test_helpers():
+    assert parse_accept("gzip;q=0.5, br, *;q=0") == {"gzip": 0.5, "br": 1.0, "*": 0.0}
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"c"')
+    assert not etag_matches('"a"', '"b"')
@@ -0,0 +1,84 @@
+""" Test the logqueue module. """
+
+
+import logging
+import time
+
+from ..logqueue import LogQueue
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def _fail(logger):
+    try:
+        raise ValueError("bad")
+    except ValueError as ex:
+        logger.error("failed", exc_info=(type(ex), ex, ex.__traceback__))
+
+
+def test_duplicates():
+    target = _ListHandler()
+    log = LogQueue([target], interval=60.0)
+    logger = logging.getLogger("test_logqueue.duplicates")
+    logger.propagate = False
+    logger.addHandler(log.handler)
+
+    log.start()
+    for _ in range(5):
+        _fail(logger)
+    logger.error("plain")
+    logger.error("plain")
+    log.stop()
+
+    assert len(target.messages) == 4
+    assert "ValueError: bad" in target.messages[0]
+    assert target.messages[1:3] == ["plain", "plain"]
+    assert target.messages[3].startswith("4 more occurrences of ValueError at ")
+
+
+def test_summary_without_records():
+    target = _ListHandler()
+    log = LogQueue([target], interval=0.2)
+    logger = logging.getLogger("test_logqueue.summary")
+    logger.propagate = False
+    logger.addHandler(log.handler)
+
+    log.start()
+    _fail(logger)
+    _fail(logger)
+
+    # The summary is written once the interval is over, not at the next record
+    deadline = time.monotonic() + 5.0
+    while len(target.messages) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    log.stop()
+
+    assert len(target.messages) == 2
+    assert target.messages[1].startswith("1 more occurrences of ValueError at ")
+
+
+def test_full_queue():
+    target = _ListHandler()
+    log = LogQueue([target], size=2, interval=0)
+    log.start()
+    log._listener.stop() # Nothing takes records from the queue now
+
+    records = [logging.LogRecord("x", logging.ERROR, "", 0, str(i), (), None) for i in range(3)]
+    for record in records:
+        log.put(record)
+    assert log.dropped == 1
+
+    log._listener.start()
+    log.stop()
+    assert target.messages == ["0", "1"]
+
+    # Written directly once stopped
+    log.put(records[2])
+    assert target.messages == ["0", "1", "2"]
@@ -0,0 +1,65 @@
+""" Test the metrics module. """
+
+
+import threading
+
+from . import call_app, make_exchange
+from ..app import WsgiApp
+from ..metrics import UNMATCHED, Metrics
+from ..router import Route
+
+
+def test_metrics():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    route = Route(None, "GET", "/a/<name>", None, {})
+
+    def record():
+        for status in (200, 200, 404):
+            metrics.begin(route)
+            metrics.record(make_exchange(route=route, status=status, duration=0.5))
+
+    threads = [threading.Thread(target=record) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The shards of the exited threads were retired
+    assert len(metrics._shards) == 0
+
+    metrics.begin(route)
+    metrics.record(make_exchange(status=404))
+
+    collected = metrics.collect()
+    total = collected[("GET", "/a/<name>")]
+    assert total["count"] == 9
+    assert total["in_flight"] == 1
+    assert total["statuses"] == {"2xx": 6, "4xx": 3}
+    assert total["buckets"] == [(0.1, 0), (1.0, 9), (float("inf"), 9)]
+    assert collected[("GET", UNMATCHED)]["count"] == 1
+
+    text = metrics.prometheus()
+    assert 'http_requests_total{method="GET",route="/a/<name>",status="2xx"} 6' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/a/<name>",le="+Inf"} 9' in text
+
+
+def test_app_metrics():
+    app = WsgiApp()
+    app.config.set("webapp.metrics.enabled", True)
+    app.config.set("webapp.metrics.path", "/metrics")
+
+    @app.route("/a/<name>")
+    def handler(exchange):
+        exchange.response.status = 200
+        exchange.response.content = "ok"
+
+    app.startup()
+    call_app(app, "/a/x")
+    call_app(app, "/missing")
+    (status, headers, body) = call_app(app, "/metrics")
+
+    assert status == "200 OK"
+    assert headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = body.decode("utf-8")
+    assert 'http_requests_total{method="GET",route="/a/<name>",status="2xx"} 1' in text
+    assert 'http_requests_total{method="GET",route="<unmatched>",status="4xx"} 1' in text
@@ -0,0 +1,100 @@
+""" Test the multipart module. """
+
+
+import io
+
+import pytest
+
+
+from ..error import RequestError, RequestTooLargeError
+from ..exchange import RequestLimits
+from ..multipart import MultipartParser, parse_header
+
+
+_BODY = (
+    b"preamble\r\n"
+    b"--XyZ\r\n"
+    b'Content-Disposition: form-data; name="field"\r\n'
+    b"\r\n"
+    b"value\r\n"
+    b"--XyZ\r\n"
+    b'Content-Disposition: form-data; name="file"; filename="C:\\dir\\a.txt"\r\n'
+    b"Content-Type: application/octet-stream\r\n"
+    b"\r\n"
+    b"line one\r\n--Xy\r\nline two\r\n"
+    b"\r\n"
+    b"--XyZ\r\n"
+    b'Content-Disposition: form-data; name="empty"\r\n'
+    b"\r\n"
+    b"\r\n"
+    b"--XyZ--\r\n"
+    b"epilogue"
+)
+
+
+def test_parse_header():
+    assert parse_header('Form-Data; name="a\\"b"; filename=x.txt') == (
+        "form-data", {"name": 'a"b', "filename": "x.txt"}
+    )
+    assert parse_header("text/plain") == ("text/plain", {})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 65536])
+def test_parse(chunk_size):
+    stream = io.BytesIO(_BODY + b"not part of the body")
+    parser = MultipartParser(stream, "XyZ", len(_BODY), chunk_size)
+
+    parts = [(part.name, part.filename, part.content_type, part.read()) for part in parser]
+    assert parts == [
+        ("field", None, "text/plain", b"value"),
+        ("file", "C:\\dir\\a.txt", "application/octet-stream", b"line one\r\n--Xy\r\nline two\r\n"),
+        ("empty", None, "text/plain", b"")
+    ]
+
+    # Never reads beyond the content length
+    assert stream.read() == b"not part of the body"
+
+
+def test_skip_unread():
+    parser = MultipartParser(io.BytesIO(_BODY), "XyZ", len(_BODY), 5)
+    assert [part.name for part in parser] == ["field", "file", "empty"]
+
+
+def test_truncated():
+    body = _BODY[:60]
+    parser = MultipartParser(io.BytesIO(body), "XyZ", len(body), 16)
+
+    with pytest.raises(RequestError):
+        for part in parser:
+            part.read()
+
+
+def test_limits():
+    def parse(**limits):
+        parser = MultipartParser(
+            io.BytesIO(_BODY), "XyZ", len(_BODY), 4, RequestLimits(**limits)
+        )
+        return [part.read() for part in parser]
+
+    assert len(parse(max_fields=3, max_field_size=5, max_file_size=26)) == 3
+
+    with pytest.raises(RequestTooLargeError):
+        parse(max_fields=2)
+
+    with pytest.raises(RequestTooLargeError):
+        parse(max_field_size=4)
+
+    with pytest.raises(RequestTooLargeError):
+        parse(max_file_size=25)
+
+
+def test_without_length():
+    def parse(**limits):
+        parser = MultipartParser(io.BytesIO(_BODY), "XyZ", None, 8, RequestLimits(**limits))
+        return [part.read() for part in parser]
+
+    assert len(parse()) == 3
+    assert len(parse(max_body=len(_BODY))) == 3
+
+    with pytest.raises(RequestTooLargeError):
+        parse(max_body=len(_BODY) - 1)
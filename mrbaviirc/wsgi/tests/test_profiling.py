@@ -0,0 +1,48 @@
+""" Test the profiling module. """
+
+
+from . import call_app, make_exchange
+from ..app import WsgiApp
+from ..profiling import Profiler
+from ..router import Route
+
+
+def test_profiler(tmp_path):
+    profiler = Profiler(str(tmp_path), routes=("slow",), secret="secret", keep=2)
+    route = Route(None, "GET", "/slow/<id>", "slow", {})
+    calls = []
+
+    profiler.run(make_exchange("/fast"), calls.append)
+    profiler.run(make_exchange("/fast", HTTP_X_PROFILE="wrong"), calls.append)
+    profiler.run(make_exchange("/fast", HTTP_X_PROFILE="\u00e9"), calls.append)
+    assert not list(tmp_path.iterdir())
+
+    profiler.run(make_exchange("/fast", HTTP_X_PROFILE="secret"), calls.append)
+    for index in range(3):
+        profiler.run(make_exchange("/slow/{0}".format(index), route=route), calls.append)
+
+    assert len(calls) == 7
+    assert len(list(tmp_path.glob("*.pstats"))) == 2
+
+
+def test_app_profiling(tmp_path):
+    app = WsgiApp()
+    app.config.set("webapp.profile.enabled", True)
+    app.config.set("webapp.profile.directory", str(tmp_path))
+    app.config.set("webapp.profile.routes", ("slow",))
+
+    @app.route("/slow", name="slow")
+    def slow(exchange):
+        exchange.response.status = 200
+        exchange.response.content = "slow"
+
+    @app.route("/fast")
+    def fast(exchange):
+        exchange.response.status = 200
+        exchange.response.content = "fast"
+
+    app.startup()
+    assert call_app(app, "/fast")[2] == b"fast"
+    assert not list(tmp_path.iterdir())
+    assert call_app(app, "/slow")[2] == b"slow"
+    assert len(list(tmp_path.glob("*slow.pstats"))) == 1
@@ -4,7 +4,10 @@
 import pytest
 
 
+from ..converters import Converter
+from ..error import RouteError
 from ..router import Router
+from ..static import StaticFiles
 
 
 def _fn1():
@@ -49,7 +52,7 @@ def test_route():
 
     (cb, params) = r.route("/c/d/37/test")
     assert cb == _fn1
-    assert params == {"name": "37", "subname": "test"}
+    assert params == {"name": 37, "subname": "test"}
 
     # this matches the first part, but no callback so next branch is checked
     (cb, params) = r.route("/c/d/38") 
@@ -59,7 +62,7 @@ def test_route():
     r.register("/c/d/<name:int>", _fn3) # adding callback, 
     (cb, params) = r.route("/c/d/38") 
     assert cb == _fn3
-    assert params == {"name": "38"}
+    assert params == {"name": 38}
 
     (cb, params) = r.route("/c/d/37c/test")
     assert cb == _fn3
@@ -75,3 +78,309 @@ def test_route():
     with pytest.raises(LookupError):
         r.get("test2", {})
     
+
+
+def test_freeze():
+    r = Router()
+
+    r.register("", _fn1)
+    r.register("/a/b", _fn1)
+    r.register("/a/b/<name>", _fn2)
+    r.register("/a/b/<name>/<subname>", _fn3)
+    r.register("/c/d/<name:int>/<subname>", _fn1)
+    r.register("/c/d/<name>", _fn2)
+    r.register("/c/d/<name>/<path:path>", _fn3)
+    r.register("/e/<name>.html", _fn1, method="POST")
+
+    paths = [
+        "", "/", "/a", "/a/b", "/a/b/", "/a/b/c", "/a/b/c/d", "/a/b/c/d/e",
+        "/c/d/37/test", "/c/d/38", "/c/d/37c/test",
+        "/c/d/38/something/else/here/", "/e/x.html"
+    ]
+
+    expected = [(path, r.route(path), r.route(path, "POST")) for path in paths]
+
+    r.freeze()
+    assert r.frozen
+    for (path, result, post_result) in expected:
+        assert r.route(path) == result
+        assert r.route(path, "POST") == post_result
+
+    assert r.route("/e/x.html", "POST") == (_fn1, {"name": "x"})
+    assert r.route("/a/b", "PUT") is None
+
+    # Registering again discards the compiled routes
+    r.register("/c/d/<name:int>", _fn3)
+    assert not r.frozen
+    assert r.route("/c/d/38") == (_fn3, {"name": 38})
+
+    r.freeze()
+    assert r.route("/c/d/38") == (_fn3, {"name": 38})
+    assert r.route("/c/d/38/x") == (_fn1, {"name": 38, "subname": "x"})
+
+
+def test_cache():
+    r = Router(cache_size=2, negative_cache_size=1)
+
+    r.register("/a/<name>", _fn1)
+    r.register("/b/<name>", _fn2)
+    r.register("/c/<name>", _fn3)
+
+    assert r.route("/a/1") == (_fn1, {"name": "1"})
+    assert r.route("/a/1") == (_fn1, {"name": "1"})
+    stats = r.cache_stats()["cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    # Changing the returned params doesn't change the cached entry
+    r.route("/a/1")[1]["name"] = "2"
+    assert r.route("/a/1") == (_fn1, {"name": "1"})
+
+    r.route("/b/1")
+    r.route("/c/1")
+    assert r.cache_stats()["cache"]["evictions"] == 1
+    assert r.cache_stats()["cache"]["size"] == 2
+
+    # Negative lookups don't evict positive ones
+    assert r.route("/x/1") is None
+    assert r.route("/x/2") is None
+    assert r.route("/x/2") is None
+    stats = r.cache_stats()
+    assert stats["cache"]["size"] == 2
+    assert stats["negative"]["size"] == 1
+    assert stats["negative"]["hits"] == 1
+    assert stats["negative"]["evictions"] == 1
+
+    # Registering clears the caches
+    r.register("/x/<name>", _fn1)
+    assert r.cache_stats()["cache"]["size"] == 0
+    assert r.route("/x/2") == (_fn1, {"name": "2"})
+
+
+def test_methods():
+    r = Router()
+
+    r.register("/a/<name>", _fn1)
+    r.register("/a/<name>", _fn2, method="post")
+    r.register("/a/<name:int>", _fn3, method="DELETE")
+    r.register("/b", _fn1, method="PUT")
+
+    for frozen in (False, True):
+        if frozen:
+            r.freeze()
+
+        assert r.route("/a/x") == (_fn1, {"name": "x"})
+        assert r.route("/a/x", "POST") == (_fn2, {"name": "x"})
+        assert r.route("/a/1", "DELETE") == (_fn3, {"name": 1})
+
+        (route, params, _) = r.match("/a/x", "POST")
+        assert (route.handler, route.method, route.path) == (_fn2, "POST", "/a/<name>")
+        assert params == {"name": "x"}
+
+        assert r.match("/a/x", "DELETE") == (None, None, {"GET", "HEAD", "POST"})
+        assert r.match("/a/1", "PATCH") == (None, None, {"GET", "HEAD", "POST", "DELETE"})
+        assert r.match("/b", "GET") == (None, None, {"PUT"})
+        assert r.match("/c", "GET") == (None, None, set())
+
+
+def test_converters():
+    import uuid
+
+    class _UpperConverter(Converter):
+        regex = "[A-Z]+"
+
+        def to_python(self, value):
+            return value.lower()
+
+        def to_url(self, value):
+            return value.upper()
+
+    r = Router()
+    r.add_converter("upper", _UpperConverter())
+
+    r.register("/int/<value:int>", _fn1, name="int")
+    r.register("/float/<value:float>", _fn1, name="float")
+    r.register("/uuid/<value:uuid>", _fn1)
+    r.register("/slug/<value:slug>", _fn1)
+    r.register("/files/<value:path>", _fn1)
+    r.register("/page-<value:int>.html", _fn1)
+    r.register("/upper/<value:upper>", _fn1, name="upper")
+    r.register("/re/<value:re:[a-z]+>", _fn1)
+
+    uuid_str = "12345678-1234-5678-1234-567812345678"
+
+    for frozen in (False, True):
+        if frozen:
+            r.freeze()
+
+        assert r.route("/int/-12") == (_fn1, {"value": -12})
+        assert r.route("/int/12x") is None
+        assert r.route("/int/-") is None
+        assert r.route("/float/1.5") == (_fn1, {"value": 1.5})
+        assert r.route("/float/.5") == (_fn1, {"value": 0.5})
+        assert r.route("/float/1.2.3") is None
+        assert r.route("/uuid/" + uuid_str) == (_fn1, {"value": uuid.UUID(uuid_str)})
+        assert r.route("/uuid/" + uuid_str[:-1] + "x") is None
+        assert r.route("/uuid/+" + uuid_str[1:]) is None
+        assert r.route("/uuid/" + uuid_str[:7] + "_" + uuid_str[8:]) is None
+        assert r.route("/slug/a-b_c") == (_fn1, {"value": "a-b_c"})
+        assert r.route("/slug/a.b") is None
+        assert r.route("/files/a/b/") == (_fn1, {"value": "a/b/"})
+        assert r.route("/page-7.html") == (_fn1, {"value": 7})
+        assert r.route("/upper/ABC") == (_fn1, {"value": "abc"})
+        assert r.route("/upper/abc") is None
+        assert r.route("/re/abc") == (_fn1, {"value": "abc"})
+
+    assert r.get("int", {"value": 5}) == "/int/5"
+    assert r.get("float", {"value": 2}) == "/float/2.0"
+    assert r.get("float", {"value": 1e20}) == "/float/100000000000000000000"
+    assert r.get("float", {"value": -1.5e-7}) == "/float/-0.00000015"
+    assert r.route(r.get("float", {"value": 1e-7})) == (_fn1, {"value": 1e-7})
+    assert r.get("upper", {"value": "abc"}) == "/upper/ABC"
+
+    for value in (float("inf"), float("nan")):
+        with pytest.raises(ValueError):
+            r.get("float", {"value": value})
+
+    with pytest.raises(ValueError):
+        r.register("/x/<value:unknown>", _fn1)
+
+
+def test_get():
+    r = Router()
+
+    r.register("/", _fn1, name="index")
+    r.register("/user/<id:int>/<name>.html", _fn1, name="user")
+    r.register("/files/<path:path>", _fn1, name="files")
+    r.register("/a/<name>", _fn2, name="user", method="POST")
+
+    assert r.get("index", {}) == "/"
+    assert r.get("user", {"id": 5, "name": "x"}) == "/user/5/x.html"
+    assert r.get("user", {"name": "y"}, method="post") == "/a/y"
+    assert r.get("user", {"id": 1, "name": "a b"}, quote=True) == "/user/1/a%20b.html"
+    assert r.get("files", {"path": "a b/c"}, quote=True) == "/files/a%20b/c"
+    assert r.get("files", {"path": "a/c"}, quote=True, query={"x": [1, 2]}) == \
+        "/files/a/c?x=1&x=2"
+
+    assert r.get_many("user", [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]) == [
+        "/user/1/a.html", "/user/2/b.html"
+    ]
+    assert r.get_many("index", [{}, {}], query=[("q", "a&b")]) == [
+        "/?q=a%26b", "/?q=a%26b"
+    ]
+
+    with pytest.raises(RouteError):
+        r.get("user", {"id": 1})
+
+    with pytest.raises(RouteError):
+        r.get_many("nothing", [])
+
+
+def test_snapshot(tmp_path):
+    filename = str(tmp_path / "routes.json")
+
+    r = Router()
+    r.register("/a/b", _fn1, name="ab", etag="weak", vary=("Accept-Language",))
+    r.register("/a/<name:int>/<path:path>", _fn2, name="path")
+    r.register("/b/<name>.html", _fn3, method="POST")
+    r.save(filename, "1")
+
+    r2 = Router()
+    assert not r2.load(filename, "2")
+    assert r2.load(filename, "1")
+    assert not r2.changed
+
+    assert r2.route("/a/b") == (_fn1, {})
+    assert r2.route("/a/5/x/y") == (_fn2, {"name": 5, "path": "x/y"})
+    assert r2.route("/b/x.html", "POST") == (_fn3, {"name": "x"})
+    assert r2.get("path", {"name": 5, "path": "x/y"}) == "/a/5/x/y"
+
+    (route, _, _) = r2.match("/a/b")
+    assert (route.path, route.name, route.options) == (
+        "/a/b", "ab", {"etag": "weak", "vary": ["Accept-Language"]}
+    )
+
+    # Registering routes from the snapshot again doesn't change anything
+    r2.register("/a/b", _fn1, name="ab", etag="weak", vary=("Accept-Language",))
+    assert not r2.changed
+    assert r2.match("/a/b")[0].options["vary"] == ("Accept-Language",)
+
+    r2.register("/a/c", _fn1)
+    assert r2.changed
+    assert r2.route("/a/c") == (_fn1, {})
+
+    def _local():
+        pass
+
+    r2.register("/a/d", _local)
+    with pytest.raises(RouteError):
+        r2.save(filename)
+
+
+def test_snapshot_objects(tmp_path):
+    filename = str(tmp_path / "routes.json")
+    static = StaticFiles(str(tmp_path))
+
+    r = Router()
+    r.register("/a", _fn1)
+    r.register("/static/<path:path>", static, name="static")
+    r.save(filename)
+
+    # Objects are left out of the snapshot and registered again
+    r2 = Router()
+    assert r2.load(filename)
+    assert r2.route("/static/x") is None
+    r2.register("/a", _fn1)
+    r2.register("/static/<path:path>", static, name="static")
+    assert not r2.changed
+    assert r2.route("/static/x") == (static, {"path": "x"})
+    assert r2.get("static", {"path": "x"}) == "/static/x"
+
+
+def test_snapshot_prune(tmp_path):
+    filename = str(tmp_path / "routes.json")
+
+    r = Router()
+    r.register("/old", _fn1, name="old")
+    r.register("/same", _fn2)
+    r.save(filename)
+
+    # A route in the snapshot that isn't registered again is removed
+    r2 = Router()
+    assert r2.load(filename)
+    r2.register("/new", _fn1, name="new")
+    r2.register("/same", _fn2)
+    assert r2.prune()
+    assert r2.changed
+    assert r2.route("/old") is None
+    assert r2.route("/new") == (_fn1, {})
+    assert r2.route("/same") == (_fn2, {})
+    with pytest.raises(RouteError):
+        r2.get("old", {})
+    r2.save(filename)
+
+    r3 = Router()
+    assert r3.load(filename)
+    r3.register("/new", _fn1, name="new")
+    r3.register("/same", _fn2)
+    assert not r3.prune()
+    assert not r3.changed
+    assert r3.route("/old") is None
+
+
+def test_head():
+    r = Router()
+    r.register("/a", _fn1)
+    r.register("/b/<name>", _fn1)
+    r.register("/b/<name>", _fn2, method="HEAD")
+    r.register("/c", _fn3, method="POST")
+
+    for frozen in (False, True):
+        if frozen:
+            r.freeze()
+
+        # HEAD is served by the GET route unless it has its own
+        assert r.route("/a", "HEAD") == (_fn1, {})
+        assert r.route("/b/x", "HEAD") == (_fn2, {"name": "x"})
+        assert r.match("/a", "POST")[2] == frozenset(("GET", "HEAD"))
+        assert r.match("/c", "HEAD")[2] == frozenset(("POST",))
@@ -0,0 +1,95 @@
+""" Test the server module. """
+
+
+import http.client
+import socket
+import threading
+
+from ..server import _WorkerServer
+
+
+def _app(environ, start_response):
+    body = environ["wsgi.input"].read(2) # Leave the rest of the body unread
+    body = environ["REQUEST_METHOD"].encode() + b" " + body
+    start_response("200 OK", [("Content-Length", str(len(body)))])
+    return [body]
+
+
+def _stream_app(environ, start_response):
+    start_response("200 OK", [])
+    return iter([b"a", b"b"])
+
+
+def _serve(app):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(8)
+    server = _WorkerServer(sock, app, 1.0, 1024)
+    threading.Thread(target=server.serve_forever, args=(0.05,)).start()
+    return server
+
+
+def test_keepalive():
+    server = _serve(_app)
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        connection.request("POST", "/", body=b"xyz" * 10)
+        response = connection.getresponse()
+        assert response.read() == b"POST xy"
+        assert response.getheader("Connection") is None
+
+        # The unread body was skipped and the connection is reused
+        sock = connection.sock
+        connection.request("HEAD", "/")
+        response = connection.getresponse()
+        assert response.getheader("Content-Length") == "5"
+        assert response.read() == b""
+        connection.request("GET", "/")
+        assert connection.getresponse().read() == b"GET "
+        assert connection.sock is sock
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_close_without_length():
+    server = _serve(_stream_app)
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        connection.request("GET", "/")
+        response = connection.getresponse()
+        assert response.getheader("Connection") == "close"
+        assert response.read() == b"ab"
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bad_connections(capsys):
+    server = _serve(_app)
+    server.keepalive = 0.2
+    try:
+        # An idle keep-alive connection is closed quietly
+        sock = socket.create_connection(("127.0.0.1", server.server_port))
+        sock.settimeout(5)
+        assert sock.recv(1) == b""
+        sock.close()
+
+        sock = socket.create_connection(("127.0.0.1", server.server_port))
+        sock.settimeout(5)
+        sock.sendall(b"GET /" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n")
+        response = b""
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+        assert response.startswith(b"HTTP/1.1 414")
+        sock.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert "Traceback" not in capsys.readouterr().err
@@ -0,0 +1,122 @@
+""" Test the static module. """
+
+
+import gzip
+import os
+
+import pytest
+
+from . import call_app
+from ..app import WsgiApp
+
+
+@pytest.fixture
+def app(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "a.txt").write_bytes(b"0123456789")
+    (root / "b.css").write_bytes(b"body {}" * 100)
+    (root / "b.css.gz").write_bytes(gzip.compress(b"body {}" * 100))
+    (tmp_path / "secret.txt").write_bytes(b"secret")
+
+    # The gzip sibling must not be older than the original
+    stat = os.stat(str(root / "b.css"))
+    os.utime(str(root / "b.css.gz"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    app = WsgiApp()
+    app.static("/static", str(root))
+    app.startup()
+    return app
+
+
+def test_get(app):
+    (status, headers, body) = call_app(app, "/static/a.txt")
+    assert (status, body) == ("200 OK", b"0123456789")
+    assert headers["Content-Type"] == "text/plain"
+    assert headers["Content-Length"] == "10"
+    assert headers["Accept-Ranges"] == "bytes"
+
+    (status, headers, body) = call_app(app, "/static/a.txt", "HEAD")
+    assert (status, body) == ("200 OK", b"")
+    assert headers["Content-Length"] == "10"
+
+    assert call_app(app, "/static/missing.txt")[0].startswith("404")
+
+
+def test_conditional(app):
+    headers = call_app(app, "/static/a.txt")[1]
+
+    (status, _, body) = call_app(app, "/static/a.txt", HTTP_IF_NONE_MATCH=headers["ETag"])
+    assert (status, body) == ("304 Not Modified", b"")
+
+    (status, _, _) = call_app(
+        app, "/static/a.txt", HTTP_IF_MODIFIED_SINCE=headers["Last-Modified"]
+    )
+    assert status == "304 Not Modified"
+
+    # If-None-Match takes precedence over If-Modified-Since
+    (status, _, _) = call_app(
+        app, "/static/a.txt", HTTP_IF_NONE_MATCH='"other"',
+        HTTP_IF_MODIFIED_SINCE=headers["Last-Modified"]
+    )
+    assert status == "200 OK"
+
+
+def test_ranges(app):
+    (status, headers, body) = call_app(app, "/static/a.txt", HTTP_RANGE="bytes=2-4")
+    assert (status, body) == ("206 Partial Content", b"234")
+    assert headers["Content-Range"] == "bytes 2-4/10"
+    assert headers["Content-Length"] == "3"
+
+    (status, headers, body) = call_app(app, "/static/a.txt", HTTP_RANGE="bytes=-3")
+    assert (status, body) == ("206 Partial Content", b"789")
+    assert headers["Content-Range"] == "bytes 7-9/10"
+
+    (status, _, body) = call_app(app, "/static/a.txt", HTTP_RANGE="bytes=5-")
+    assert (status, body) == ("206 Partial Content", b"56789")
+
+    (status, headers, _) = call_app(app, "/static/a.txt", HTTP_RANGE="bytes=10-20")
+    assert status.startswith("416")
+    assert headers["Content-Range"] == "bytes */10"
+
+    # Multiple ranges are answered with the whole file
+    (status, _, body) = call_app(app, "/static/a.txt", HTTP_RANGE="bytes=0-1,3-4")
+    assert (status, body) == ("200 OK", b"0123456789")
+
+
+def test_if_range(app):
+    etag = call_app(app, "/static/a.txt")[1]["ETag"]
+
+    (status, _, body) = call_app(
+        app, "/static/a.txt", HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=etag
+    )
+    assert (status, body) == ("206 Partial Content", b"01")
+
+    (status, _, body) = call_app(
+        app, "/static/a.txt", HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"stale"'
+    )
+    assert (status, body) == ("200 OK", b"0123456789")
+
+
+def test_precompressed(app):
+    (status, headers, body) = call_app(app, "/static/b.css", HTTP_ACCEPT_ENCODING="gzip")
+    assert status == "200 OK"
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert headers["Content-Type"] == "text/css"
+    assert gzip.decompress(body) == b"body {}" * 100
+    gzip_etag = headers["ETag"]
+
+    (status, headers, body) = call_app(app, "/static/b.css")
+    assert "Content-Encoding" not in headers
+    assert headers["Vary"] == "Accept-Encoding"
+    assert body == b"body {}" * 100
+    assert headers["ETag"] != gzip_etag
+
+
+def test_traversal(app):
+    for path in ("/static/../secret.txt", "/static/a/../../secret.txt",
+                 "/static/..%2fsecret.txt", "/static/a.txt\0", "/static/..\\secret.txt"):
+        (status, _, body) = call_app(app, path)
+        assert status.startswith("404"), path
+        assert body != b"secret"
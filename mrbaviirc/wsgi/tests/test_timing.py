@@ -0,0 +1,30 @@
+""" Test the timing module. """
+
+
+from ..timing import NULL_TIMING, Timing
+
+
+def test_timing():
+    timing = Timing()
+    timing.begin("parse")
+    timing.begin("handler")
+    with timing.span("db"):
+        pass
+    timing.end()
+
+    assert [name for (name, _) in timing.spans] == ["parse", "db", "handler"]
+    assert timing.total() >= sum(seconds for (name, seconds) in timing.spans if name != "db")
+
+    header = timing.header()
+    assert header.startswith("parse;dur=")
+    assert header.split(", ")[-1].startswith("total;dur=")
+
+
+def test_null_timing():
+    NULL_TIMING.begin("parse")
+    with NULL_TIMING.span("db"):
+        pass
+    NULL_TIMING.end()
+
+    assert not NULL_TIMING.enabled
+    assert NULL_TIMING.spans == ()
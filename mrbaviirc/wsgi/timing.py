@@ -0,0 +1,136 @@
+""" Per request timing of named spans. """
+
+from __future__ import absolute_import
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2020 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+__all__ = ["Timing", "NULL_TIMING"]
+
+
+from time import perf_counter
+
+
+class _Span:
+    """ Context manager timing one span. """
+
+    __slots__ = ("timing", "name", "start")
+
+    def __init__(self, timing, name):
+        self.timing = timing
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timing.add(self.name, perf_counter() - self.start)
+
+
+class _NullSpan:
+    """ Context manager that does nothing. """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Timing:
+    """ The durations of the named spans of an exchange.
+        The app moves through the parse, routing, handler, finalize, and
+        encode stages with begin, each one ending the one before.  Handlers
+        can time their own spans with "with exchange.timing.span(name):".
+        For a streamed body, encode only covers preparing the body.
+    """
+
+    __slots__ = ("spans", "_current", "_start", "_first", "_last")
+
+    enabled = True
+
+    def __init__(self):
+        """ Initialize the timing. """
+        self.spans = [] # (name, seconds) in the order they ended
+        self._current = None
+        self._start = None
+        self._first = None
+        self._last = None
+
+    def begin(self, name):
+        """ End the current stage and begin another. """
+        now = perf_counter()
+        if self._current is not None:
+            self.spans.append((self._current, now - self._start))
+        elif self._first is None:
+            self._first = now
+
+        self._current = name
+        self._start = now
+
+    def end(self):
+        """ End the current stage. """
+        now = perf_counter()
+        if self._current is not None:
+            self.spans.append((self._current, now - self._start))
+            self._current = None
+        self._last = now
+
+    def span(self, name):
+        """ Return a context manager that times a span. """
+        return _Span(self, name)
+
+    def add(self, name, seconds):
+        """ Record the duration of a span. """
+        self.spans.append((name, seconds))
+
+    def total(self):
+        """ Return the seconds from the first stage to the end. """
+        if self._first is None:
+            return 0.0
+        return (self._last or perf_counter()) - self._first
+
+    def header(self):
+        """ Return the value of a Server-Timing header. """
+        parts = [
+            "{0};dur={1:.3f}".format(name, seconds * 1000.0)
+            for (name, seconds) in self.spans
+        ]
+        parts.append("total;dur={0:.3f}".format(self.total() * 1000.0))
+        return ", ".join(parts)
+
+
+class _NullTiming:
+    """ The timing of an exchange when timing is disabled. """
+
+    __slots__ = ()
+
+    enabled = False
+    spans = ()
+
+    def begin(self, name):
+        pass
+
+    def end(self):
+        pass
+
+    def span(self, name):
+        return _NULL_SPAN
+
+    def add(self, name, seconds):
+        pass
+
+    def total(self):
+        return 0.0
+
+
+NULL_TIMING = _NullTiming()